@@ -0,0 +1,246 @@
+import random
+import threading
+import time
+
+from hoil_plan_cache import Planner, CachedPlanner, PlanCache
+
+
+class SceneObject:
+    def __init__(self, id: str, x= 0.0, y= 0.0, z= 0.0, height= 0.0):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.z = z
+        self.height = height
+
+
+class ArmBackend:
+    """
+    Arm the interpreter drives. Override every method.
+    scene_objects lists the SceneObjects the program can grab, exposed to HOIL as %boxes%.
+    """
+    scene_objects = []
+
+    def MoveTo(self, x, y, z, wait= True):
+        """Move the end effector to x, y, z"""
+        raise NotImplementedError
+
+    def MoveBy(self, x, y, z, wait= True):
+        """Add x, y, z to the end effector position"""
+        raise NotImplementedError
+
+    def MoveAlong(self, moves: list, wait= True):
+        """Follow moves, a list of (relative, x, y, z) MoveBy/MoveTo targets, as one path.
+        Backends without path planning move segment by segment"""
+        for relative, x, y, z in moves:
+            if relative:
+                self.MoveBy(x, y, z, wait)
+            else:
+                self.MoveTo(x, y, z, wait)
+
+    def OpenGripper(self, wait= True):
+        raise NotImplementedError
+
+    def CloseGripper(self, wait= True):
+        raise NotImplementedError
+
+    def AttachObject(self, id: str):
+        """Attach scene object id to the end effector, so it moves with the arm"""
+        raise NotImplementedError
+
+    def DetachObject(self):
+        """Detach the attached object, leaving it where it is"""
+        raise NotImplementedError
+
+    def Position(self) -> tuple:
+        """x, y, z of the end effector"""
+        raise NotImplementedError
+
+
+class StateCache:
+    """
+    Last known end effector pose and joint values of an arm, so queries do not round-trip to the controller.
+    A stored pose is trusted for maxAge seconds, and only while the joint values reported since
+    stay within jointTolerance of the first ones reported after it was stored.
+    """
+    def __init__(self, maxAge= 5.0, jointTolerance= 1e-3):
+        self.maxAge = maxAge
+        self.jointTolerance = jointTolerance
+        self.hits = 0
+        self.misses = 0
+        self._pose = None
+        self._poseTime = 0.0
+        self._poseJoints = None
+        self._joints = None
+        self._jointsTime = 0.0
+        self._lock = threading.Lock()
+
+    def SetPose(self, pose):
+        with self._lock:
+            self._pose = pose
+            self._poseTime = time.monotonic()
+            self._poseJoints = None
+
+    def SetJoints(self, joints: tuple):
+        """Feed the joint values reported by the arm. Joints drifting away from the stored pose invalidate it"""
+        with self._lock:
+            self._joints = joints
+            self._jointsTime = time.monotonic()
+
+            if self._pose is None:
+                return
+            if self._poseJoints is None:
+                self._poseJoints = joints
+            elif len(joints) != len(self._poseJoints) or \
+                max(abs(a - b) for a, b in zip(joints, self._poseJoints)) > self.jointTolerance:
+                self._pose = None
+
+    def Invalidate(self):
+        with self._lock:
+            self._pose = None
+
+    def Pose(self):
+        """The stored pose, or None if there is none or it may be stale"""
+        with self._lock:
+            if self._pose is not None and time.monotonic() - self._poseTime <= self.maxAge:
+                self.hits += 1
+                return self._pose
+            self.misses += 1
+            return None
+
+    def Joints(self, maxAge: float):
+        """The last reported joint values if they are at most maxAge seconds old, otherwise None"""
+        with self._lock:
+            if self._joints is not None and time.monotonic() - self._jointsTime <= maxAge:
+                return self._joints
+            return None
+
+    def Stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class SimulatedPlanner(Planner):
+    """
+    Stand-in planner of SimulatedArm. Its joints are the end effector position, a target is
+    one or more x, y, z waypoints, and a plan is the polyline (start, target) and takes planningTime seconds to make.
+    """
+    def __init__(self, arm, planningTime= 0.0):
+        self.arm = arm
+        self.planningTime = planningTime
+        self.plans = 0
+
+    def CurrentJoints(self) -> tuple:
+        return self.arm.Position()
+
+    def SceneRevision(self) -> int:
+        return self.arm.sceneRevision
+
+    def Plan(self, target: tuple):
+        self.plans += 1
+        if self.planningTime > 0:
+            time.sleep(self.planningTime)
+        return (self.arm.Position(), tuple(target))
+
+    def Execute(self, trajectory, wait= True):
+        start, target = trajectory
+        distance = 0.0
+        for i in range(0, len(target), 3):
+            distance += sum((target[i + axis] - start[axis]) ** 2 for axis in range(3)) ** 0.5
+            start = target[i : i + 3]
+
+        # One motion, however many waypoints: the arm does not stop in between
+        self.arm._Travel(distance)
+        with self.arm._lock:
+            self.arm._Place(*target[-3 :])
+
+
+class SimulatedArm(ArmBackend):
+    """
+    In-process kinematic arm for headless runs, tests and benchmarks. No collisions:
+    every motion takes planningTime seconds to plan, unless the plan is cached, and reaches its target
+    after latency seconds (plus distance / speed, if speed is set).
+    The attached object follows the end effector. Without sceneObjects, the scene is DemoScene(seed= seed).
+    """
+    def __init__(self, latency= 0.0, speed= None, sceneObjects: list = None, start= (0.5, 0.0, 0.5),
+                 planningTime= 0.0, planCache: PlanCache = None, seed= None):
+        self.latency = latency
+        self.speed = speed
+        self.scene_objects = DemoScene(seed= seed) if sceneObjects is None else sceneObjects
+        self.x, self.y, self.z = start
+        self.gripperOpen = True
+        self.attached = None
+        self.motions = 0
+        self.sceneRevision = 0
+        self.planner = CachedPlanner(SimulatedPlanner(self, planningTime), planCache)
+        self._lock = threading.Lock()
+
+    def MoveTo(self, x, y, z, wait= True):
+        self.planner.Execute(self.planner.Plan((x, y, z)), wait)
+
+    def MoveBy(self, x, y, z, wait= True):
+        self.MoveTo(self.x + x, self.y + y, self.z + z, wait)
+
+    def MoveAlong(self, moves: list, wait= True):
+        target = []
+        x, y, z = self.Position()
+        for relative, mx, my, mz in moves:
+            if relative:
+                x, y, z = x + mx, y + my, z + mz
+            else:
+                x, y, z = mx, my, mz
+            target.extend((x, y, z))
+        self.planner.Execute(self.planner.Plan(tuple(target)), wait)
+
+    def OpenGripper(self, wait= True):
+        self._Travel(0.0)
+        self.gripperOpen = True
+
+    def CloseGripper(self, wait= True):
+        self._Travel(0.0)
+        self.gripperOpen = False
+
+    def AttachObject(self, id: str):
+        obj = self.Object(id)
+        if obj is None:
+            raise Exception(f'SimulatedArm:: no scene object {id}')
+        self.attached = obj
+        self.sceneRevision += 1
+
+    def DetachObject(self):
+        self.attached = None
+        self.sceneRevision += 1
+
+    def Object(self, id: str):
+        for obj in self.scene_objects:
+            if obj.id == id:
+                return obj
+        return None
+
+    def Position(self) -> tuple:
+        return (self.x, self.y, self.z)
+
+    def _Travel(self, distance: float):
+        self.motions += 1
+        delay = self.latency
+        if self.speed:
+            delay += distance / self.speed
+        if delay > 0:
+            time.sleep(delay)
+
+    def _Place(self, x, y, z):
+        if self.attached is not None:
+            self.attached.x += x - self.x
+            self.attached.y += y - self.y
+            self.attached.z += z - self.z
+        self.x, self.y, self.z = x, y, z
+
+
+def DemoScene(count= 5, seed= None) -> list:
+    """count sticks of different heights standing at <0, 0.25 ~ 0.5, height / 2>, as in the sorting demo"""
+    rng = random.Random(seed)
+    heights = rng.sample([0.05 + 0.025 * i for i in range(count * 2)], count)
+    objs = []
+    for i in range(count):
+        y = 0.25 + 0.25 * i / max(1, count - 1)
+        objs.append(SceneObject(f'stick{i}', 0.0, y, heights[i] / 2, heights[i]))
+    return objs
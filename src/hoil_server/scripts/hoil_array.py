@@ -0,0 +1,240 @@
+from collections.abc import MutableMapping
+import operator
+import typing
+
+# NumPy is optional. Without it the bulk operations use the Python builtins
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Below this many elements the conversion to and from NumPy costs more than it saves
+NUMPY_MIN_SIZE = 64
+
+
+def _Index(key):
+    """HOIL numbers are floats, so 2.0 addresses element 2"""
+    if key.__class__ is float and key.is_integer():
+        return int(key)
+    if key.__class__ is bool:
+        return int(key)
+    return key
+
+
+class HoilArray(MutableMapping):
+    """
+    Value of HOIL $array variables. Behaves like the dict HOIL arrays used to be, but while
+    the elements are written in order at 0, 1, 2... they are kept in a list, which is smaller,
+    faster to index and lets the bulk operations below work on a plain sequence.
+    Writing anywhere else (past the end, a negative or fractional index) turns it into a dict for good.
+    """
+    __slots__ = ('_dense', '_sparse')
+
+    def __init__(self, values: typing.Iterable = ()):
+        self._dense = list(values)
+        self._sparse = None
+
+    @staticmethod
+    def FromMapping(mapping: typing.Mapping) -> 'HoilArray':
+        arr = HoilArray()
+        for key, val in mapping.items():
+            arr[key] = val
+        return arr
+
+    def IsDense(self) -> bool:
+        return self._dense is not None
+
+    def __getitem__(self, key):
+        dense = self._dense
+        if dense is None:
+            return self._sparse[_Index(key)]
+
+        i = _Index(key)
+        if i.__class__ is int and 0 <= i < len(dense):
+            return dense[i]
+        raise KeyError(key)
+
+    def __setitem__(self, key, val):
+        dense = self._dense
+        i = _Index(key)
+        if dense is not None:
+            if i.__class__ is int and 0 <= i <= len(dense):
+                if i == len(dense):
+                    dense.append(val)
+                else:
+                    dense[i] = val
+                return
+            self._ToSparse()
+        self._sparse[i] = val
+
+    def __delitem__(self, key):
+        dense = self._dense
+        i = _Index(key)
+        if dense is not None:
+            if i.__class__ is int and i == len(dense) - 1:
+                dense.pop()
+                return
+            self._ToSparse()
+        del self._sparse[i]
+
+    def __iter__(self):
+        if self._dense is not None:
+            return iter(range(len(self._dense)))
+        return iter(self._sparse)
+
+    def __len__(self):
+        if self._dense is not None:
+            return len(self._dense)
+        return len(self._sparse)
+
+    def __repr__(self):
+        if self._dense is not None:
+            return f'HoilArray({self._dense!r})'
+        return f'HoilArray.FromMapping({self._sparse!r})'
+
+    def __str__(self):
+        # Interpolated into strings as the dict HOIL arrays used to be
+        return str(dict(self.items()))
+
+    def _ToSparse(self):
+        self._sparse = dict(enumerate(self._dense))
+        self._dense = None
+
+
+def Elements(arr: typing.Mapping) -> tuple:
+    """(indices, values) of a HOIL array, either a HoilArray or a dict"""
+    if isinstance(arr, HoilArray) and arr.IsDense():
+        return range(len(arr._dense)), arr._dense
+    return list(arr.keys()), list(arr.values())
+
+
+def ArrayOf(indices: typing.Sequence, values: list) -> HoilArray:
+    """Array of values at indices, as returned by Elements()"""
+    if isinstance(indices, range):
+        return HoilArray(values)
+    return HoilArray.FromMapping(dict(zip(indices, values)))
+
+
+def _Number(index):
+    return float(index) if index.__class__ is int else index
+
+
+def _NonEmpty(name: str, values: list):
+    if len(values) == 0:
+        raise Exception(f'{name}:: empty array')
+
+
+def _Floats(values: list):
+    """values as a NumPy float array, or None if NumPy is missing, values is short or not all numbers"""
+    if numpy is None or len(values) < NUMPY_MIN_SIZE:
+        return None
+    try:
+        return numpy.asarray(values, dtype= float)
+    except (TypeError, ValueError):
+        return None
+
+
+def Sum(arr: typing.Mapping):
+    _, values = Elements(arr)
+    floats = _Floats(values)
+    if floats is not None:
+        return floats.sum().item()
+    return sum(values)
+
+
+def Min(arr: typing.Mapping):
+    _, values = Elements(arr)
+    _NonEmpty('Min', values)
+    return min(values)
+
+
+def Max(arr: typing.Mapping):
+    _, values = Elements(arr)
+    _NonEmpty('Max', values)
+    return max(values)
+
+
+def ArgMin(arr: typing.Mapping):
+    """Index of the smallest element, the first one on ties"""
+    indices, values = Elements(arr)
+    _NonEmpty('ArgMin', values)
+    floats = _Floats(values)
+    if floats is not None:
+        return _Number(indices[int(floats.argmin())])
+    return _Number(indices[min(range(len(values)), key= values.__getitem__)])
+
+
+def ArgMax(arr: typing.Mapping):
+    """Index of the largest element, the first one on ties"""
+    indices, values = Elements(arr)
+    _NonEmpty('ArgMax', values)
+    floats = _Floats(values)
+    if floats is not None:
+        return _Number(indices[int(floats.argmax())])
+    return _Number(indices[max(range(len(values)), key= values.__getitem__)])
+
+
+def Sort(arr: typing.Mapping) -> HoilArray:
+    """The elements in ascending order, as a new dense array"""
+    _, values = Elements(arr)
+    floats = _Floats(values)
+    if floats is not None:
+        return HoilArray(numpy.sort(floats).tolist())
+    return HoilArray(sorted(values))
+
+
+def ArgSort(arr: typing.Mapping) -> HoilArray:
+    """Indices of the elements in ascending order of the elements, as a new dense array. Stable"""
+    indices, values = Elements(arr)
+    floats = _Floats(values)
+    if floats is not None:
+        order = floats.argsort(kind= 'stable').tolist()
+    else:
+        order = sorted(range(len(values)), key= values.__getitem__)
+    return HoilArray([_Number(indices[i]) for i in order])
+
+
+def Elementwise(op: typing.Callable, a: typing.Mapping, b) -> HoilArray:
+    """op applied to the elements of a and b, an array of the same indices or a number"""
+    indices, values = Elements(a)
+    if isinstance(b, typing.Mapping):
+        missing = [index for index in indices if index not in b]
+        if len(missing) > 0:
+            raise Exception(f'Elementwise:: no element at {_Number(missing[0])} in the second array')
+        others = [b[index] for index in indices]
+    elif b.__class__ in (float, int, bool):
+        others = None
+    else:
+        raise Exception(f'Elementwise:: expected an array or a number, got {b!r}')
+
+    floats = _Floats(values)
+    otherFloats = b if others is None else _Floats(others)
+    try:
+        if floats is not None and otherFloats is not None:
+            # Raise on division by zero like the Python operators instead of giving inf or nan
+            with numpy.errstate(divide= 'raise', invalid= 'raise'):
+                res = op(floats, otherFloats).tolist()
+        elif others is not None:
+            res = [op(x, y) for x, y in zip(values, others)]
+        else:
+            res = [op(x, b) for x in values]
+    except (TypeError, ArithmeticError) as e:
+        raise Exception(f'Elementwise:: {e}')
+    return ArrayOf(indices, res)
+
+
+# Natives over arrays as (name, params, function of the param values)
+ARRAY_NATIVES = [
+    ('Sum', ['arr'], Sum),
+    ('Min', ['arr'], Min),
+    ('Max', ['arr'], Max),
+    ('ArgMin', ['arr'], ArgMin),
+    ('ArgMax', ['arr'], ArgMax),
+    ('Sort', ['arr'], Sort),
+    ('ArgSort', ['arr'], ArgSort),
+    ('Add', ['a', 'b'], lambda a, b: Elementwise(operator.add, a, b)),
+    ('Sub', ['a', 'b'], lambda a, b: Elementwise(operator.sub, a, b)),
+    ('Mul', ['a', 'b'], lambda a, b: Elementwise(operator.mul, a, b)),
+    ('Div', ['a', 'b'], lambda a, b: Elementwise(operator.truediv, a, b)),
+]
@@ -1,27 +1,83 @@
 from hoil_utils import ExecVarContainer, EvaluateExpr
 from collections import deque
+import functools
 import typing
 import re
 
+
+_Placeholder = re.compile(r'\{[^}]*\}')
+
+
+class StringTemplate:
+    """
+    A string split once into literal chunks and the {var} placeholders between them,
+    so interpolating it is one variable lookup per placeholder and a single join.
+    chunks has one more element than names: chunks[i] precedes placeholder i.
+    """
+    __slots__ = ('chunks', 'names', '_binding')
+
+    def __init__(self, string: str):
+        self.chunks = []
+        self.names = []
+        begin = 0
+        for match in _Placeholder.finditer(string):
+            self.chunks.append(string[begin : match.start()])
+            self.names.append(f'%{match.group()[1 : -1]}%')
+            begin = match.end()
+        self.chunks.append(string[begin :])
+
+        # (symbol table, slot of each placeholder), resolved on the first Render()
+        self._binding = None
+
+    def Render(self, varTable) -> str:
+        binding = self._binding
+        if binding is None or binding[0] is not varTable.symbols:
+            binding = (varTable.symbols, [varTable.symbols.Resolve(name) for name in self.names])
+            self._binding = binding
+
+        chunks = self.chunks
+        parts = [chunks[0]]
+        for i, slot in enumerate(binding[1]):
+            val: DType
+            val = varTable.GetSlot(slot)
+            if val is None:
+                raise Exception(f"Use of undeclared variable {self.names[i]} in a string!")
+            parts.append(str(val.Get()))
+            parts.append(chunks[i + 1])
+        return ''.join(parts)
+
+
+@functools.lru_cache(maxsize= 4096)
+def Template(string: str) -> typing.Optional[StringTemplate]:
+    """Parsed template of string, None if it has no placeholders. Templates are shared by equal strings"""
+    if _Placeholder.search(string) is None:
+        return None
+    return StringTemplate(string)
+
+
 class DType:
-    
+    """
+    Variable cell. A cell holding a string becomes a StringCell, which keeps the parsed template of the string,
+    and goes back to a plain DType when assigned any other value, so Get() only checks for placeholders on strings.
+    The class follows the value, not the declared type: HOIL lets a variable be reassigned a value of any type.
+    Both classes share one __slots__ layout, which is what lets a cell change class.
+    """
+    __slots__ = ('_container', '_val', '_template', 'fixed')
+
     def __init__(self, container:ExecVarContainer, expr= None, paramDecl= False, directAssignment= False, fixed= False):
-        self._assigned = False
         self._container = container
-        self._expr = expr
         self._val = None
-        self._directAssignment = directAssignment
-
+        self._template = None
 
         # If true, subsequent Assign is ignored.
         # TODO: refactor this
         self.fixed = fixed
 
-        if self._expr is not None and not paramDecl:
-            if self._directAssignment:
-                self.AssignValue(self._expr)
+        if expr is not None and not paramDecl:
+            if directAssignment:
+                self.AssignValue(expr)
             else:
-                self.Assign(self._expr)
+                self.Assign(expr)
 
 
     def Assign(self, expr:str):
@@ -32,41 +88,39 @@ class DType:
         if self.fixed:
             return
         
-        self._expr = expr
-        self._assigned = True
-        self._val = self._Eval()
+        self.AssignValue(EvaluateExpr(expr, self._container))
 
     def AssignValue(self, val):
         """
         Directly set the value. Useful for LLM-based writing
         """
         if val is not None:
-            self._assigned = True
+            cell = StringCell if type(val) is str else DType
+            if cell is not self.__class__:
+                self.__class__ = cell
+        self._Set(val)
+
+    def _Set(self, val):
         self._val = val
 
-    def _Eval(self) -> object:
-        return EvaluateExpr(self._expr, self._container)
-    
     def Get(self):
         # TODO: Raise error on use-before-assignment
         if self._val is None:
             raise Exception(f"Use of variable before assignment!")
-        else:
-            # if it's string, interpolate.
-            if isinstance(self._val, str):
-                string: str
-                string = self._val
-                regex = '\{[^}]*\}'
-                res = set(re.findall(regex, string))
-
-                if res:
-                    for match in res:
-                        val: DType
-                        val = self._container.varTable.Get(f'%{match[1 : -1]}%')
-                        string = string.replace(match, str(val.Get()))
-
-                return string
-    
-            return self._val
-        
+        return self._val
+
+
+class StringCell(DType):
+    """String, interpolated on every read"""
+    __slots__ = ()
 
+    def _Set(self, val):
+        self._val = val
+        self._template = None if val is None else Template(val)
+
+    def Get(self):
+        if self._val is None:
+            raise Exception(f"Use of variable before assignment!")
+        if self._template is not None:
+            return self._template.Render(self._container.varTable)
+        return self._val
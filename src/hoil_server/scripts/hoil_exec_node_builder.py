@@ -4,27 +4,66 @@ from collections import deque
 import typing
 import shlex
 
+class LineStream:
+    """
+    Streams IL statements from an iterable of lines (e.g. a file object).
+    Each line is tokenised exactly once, when it becomes the current statement.
+    """
+    def __init__(self, lines: typing.Iterable[str], verbose= False):
+        self._lines = iter(lines)
+        self._verbose = verbose
+        self._line = None
+        self._Advance()
+
+    def _Advance(self):
+        self._line = None
+        for raw in self._lines:
+            line = shlex.split(raw, posix= False)
+            if len(line) > 0:
+                if self._verbose:
+                    print(f'BuildExecNode():: Current stmt: {raw.rstrip()}')
+                self._line = line
+                return
+
+    def Empty(self) -> bool:
+        return self._line is None
+
+    def Peek(self) -> list:
+        """Tokens of the current statement"""
+        return self._line
+
+    def Pop(self) -> list:
+        """Consume the current statement and return its tokens"""
+        line = self._line
+        self._Advance()
+        return line
+
+
 class ExecNodeBuilder:
+    # Statements handled by this builder
+    opcodes = ()
+
     def __init__(self, container:ExecVarContainer):
         self.container = container
 
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
+        # opcode -> builder table this builder belongs to. Used to build nested blocks
+        self.table = None
+
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
         # Override this
         return None
-    
-    def GetLine(self, stack: deque) -> list:
-        return shlex.split(stack[0], posix= False)
+
+    def BuildBlock(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        return _BuildExecNode(stream, self.container, self.table)
 
 class DeclNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$decl',)
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack:deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-        if line[0] != '$decl':
-            return None
-        
-        stack.popleft()
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
         if len(line) == 4:
             return DeclNode(self.container, line[1], line[2], line[3])
         else:
@@ -32,33 +71,27 @@ class DeclNodeBuilder(ExecNodeBuilder):
 
 
 class InsertNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$insert',)
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack:deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-        if line[0] != '$insert':
-            return None
-        
-        stack.popleft()
-
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
         return InsertNode(self.container, line[1], line[2], line[3])
 
 
 class BranchNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$branch_begin',)
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-
-        if line[0] != '$branch_begin':
-            return None
-        
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
         branchNode = BranchNode(self.container)
 
-        stack.popleft()
-        line = self.GetLine(stack)
+        stream.Pop()
+        line = stream.Peek()
         
         while line[0] != '$branch_end':
             if line[0] == '$if' or line[0] == '$elif':
@@ -68,61 +101,58 @@ class BranchNodeBuilder(ExecNodeBuilder):
                     cond = InstructNode(self.container, line[2])
                 else:
                     cond = ExprNode(self.container, line[1])
-                stack.popleft()
+                stream.Pop()
 
                 # Will always terminate upon '$*_end'
-                stmt = _BuildExecNode(stack, self.container)
+                stmt = self.BuildBlock(stream)
                 
                 condNode.condNode = cond
                 condNode.execNode = stmt
 
-                line = self.GetLine(stack)
+                line = stream.Pop()
 
                 if line[0] == '$if_end':
                     branchNode.ifNode = condNode
                 else:
                     branchNode.elifNodes.append(condNode)
-                stack.popleft()
             elif line[0] == '$else_begin':
-                stack.popleft()
-                node = _BuildExecNode(stack, self.container)
+                stream.Pop()
+                node = self.BuildBlock(stream)
 
                 branchNode.elseNode = node
-                stack.popleft()
+                stream.Pop()
+            else:
+                raise Exception(f'BuildExecNode():: unexpected statement in branch: {line}')
         
-            line = self.GetLine(stack)
+            line = stream.Peek()
 
-        stack.popleft()
+        stream.Pop()
         return branchNode
 
 class ScopedNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$open_scope',)
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
     
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-
-        if line[0] != '$open_scope':
-            return None
-        
-        stack.popleft()
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        stream.Pop()
         scopedNode = ScopedNode(self.container)
-        scopedNode.node = _BuildExecNode(stack, self.container)
-        stack.popleft()
+        scopedNode.node = self.BuildBlock(stream)
+        stream.Pop()
 
         return scopedNode
 
 class LoopNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$while',)
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-
-        if line[0] != '$while':
-            return None
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
 
-        if line[1] == '$instruct':
+        if len(line) > 1 and line[1] == '$instruct':
             cond = InstructNode(self.container, line[2])
         else:
 
@@ -130,58 +160,46 @@ class LoopNodeBuilder(ExecNodeBuilder):
 
             if len(line) == 2:
                 cond = ExprNode(self.container, line[1])
-    
-        stack.popleft()
 
-        body = _BuildExecNode(stack, self.container)
+        body = self.BuildBlock(stream)
 
         # Pop $while_end
-        stack.popleft()
+        stream.Pop()
 
         return LoopNode(self.container, cond, body)
 
 class JumpNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$break', '$continue')
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
     
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
 
-        
         if line[0] == '$break':
-            stack.popleft()
             return BreakNode(self.container)
-        elif line[0] == '$continue':
-            stack.popleft()
-            return ContinueNode(self.container)
-
-        return None
+        return ContinueNode(self.container)
     
 class InstructNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$instruct',)
+
     def __init__(self, container:ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-
-        if line[0] != '$instruct':
-            return None
-
-        node = InstructNode(self.container, line[1])
-        stack.popleft()
-
-        return node
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
+        return InstructNode(self.container, line[1])
     
 class FunctionNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$func_decl',)
+
     def __init__(self, container: ExecVarContainer):
         super().__init__(container)
     
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
 
-        if line[0] != '$func_decl':
-            return None
-        
         self.container.varTable = self.container.varTable.Isolate()
         
         # TODO: Parse param
@@ -208,44 +226,38 @@ class FunctionNodeBuilder(ExecNodeBuilder):
             param.append(DeclNode(self.container, param_ident, param_type, None, paramDecl= True))
             param_index += 1
 
-        stack.popleft()
-
-        node = _BuildExecNode(stack, self.container)
+        node = self.BuildBlock(stream)
 
-        stack.popleft()
+        stream.Pop()
 
         funcNode = FunctionNode(self.container, ident, param, node)
         return funcNode
 
 
 class ReturnNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$return',)
+
     def __init__(self, container: ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-
-        if line[0] != '$return':
-            return None
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
         
         if len(line) == 1:
             expr = ''
         else:
             expr = line[1]
 
-        node = ReturnNode(self.container, expr)
-        stack.popleft()
-        return node
+        return ReturnNode(self.container, expr)
 
 class CallNodeBuilder(ExecNodeBuilder):
+    opcodes = ('$call',)
+
     def __init__(self, container: ExecVarContainer):
         super().__init__(container)
 
-    def Run(self, stack: deque) -> typing.Optional[ExecNode]:
-        line = self.GetLine(stack)
-
-        if line[0] != '$call':
-            return None
+    def Run(self, stream: LineStream) -> typing.Optional[ExecNode]:
+        line = stream.Pop()
         
         args = []
 
@@ -278,77 +290,82 @@ class CallNodeBuilder(ExecNodeBuilder):
             if len(arg) > 0:
                 args.append(arg)
 
-        node = CallNode(self.container, line[1], args)
-        stack.popleft()
-
-        return node
-
+        return CallNode(self.container, line[1], args)
+
+
+
+# Statements closing the block being built. Consumed by the builder that opened it.
+_BlockEnd = {
+    '$if_end',
+    '$elif_end',
+    '$else_end',
+    '$close_scope',
+    '$branch_end',
+    '$while_end',
+    '$func_decl_end',
+}
+
+_BuilderClasses = (
+    DeclNodeBuilder,
+    InsertNodeBuilder,
+    BranchNodeBuilder,
+    ScopedNodeBuilder,
+    LoopNodeBuilder,
+    JumpNodeBuilder,
+    InstructNodeBuilder,
+    FunctionNodeBuilder,
+    ReturnNodeBuilder,
+    CallNodeBuilder,
+)
+
+
+def _MakeBuilderTable(container:ExecVarContainer) -> dict:
+    """opcode -> builder. Builders are created once per program"""
+    table = dict()
+    for builderClass in _BuilderClasses:
+        builder = builderClass(container)
+        builder.table = table
+        for opcode in builder.opcodes:
+            table[opcode] = builder
+    return table
 
             
-def _BuildExecNode(stack: deque, container:ExecVarContainer) -> typing.Optional[ExecNode]:
+def _BuildExecNode(stream: LineStream, container:ExecVarContainer, table: dict) -> typing.Optional[ExecNode]:
     """Called recursively to create linked list of execnodes.
     Exit upon encountering end region (if_end, while_end etc)
     as well-formed program will always have a matching pair and therefore a matching func call to handle them"""
-    
-    builderList = list()
-    builderList.append(DeclNodeBuilder(container))
-    builderList.append(InsertNodeBuilder(container))
-    builderList.append(BranchNodeBuilder(container))
-    builderList.append(ScopedNodeBuilder(container))
-    builderList.append(LoopNodeBuilder(container))
-    builderList.append(JumpNodeBuilder(container))
-    builderList.append(InstructNodeBuilder(container))
-    builderList.append(FunctionNodeBuilder(container))
-    builderList.append(ReturnNodeBuilder(container))
-    builderList.append(CallNodeBuilder(container))
-
-
-
-
-    head = EmptyNode(container)
+    head = None
     cur = None
 
-    while len(stack) > 0:
-        print(f'BuildExecNode():: Current stmt: {stack[0]}')
+    while not stream.Empty():
+        line = stream.Peek()
 
-        if  stack[0] == '$if_end'        or\
-            stack[0] == '$elif_end'      or\
-            stack[0] == '$else_end'      or\
-            stack[0] == '$close_scope'   or\
-            stack[0] == '$branch_end'    or\
-            stack[0] == '$while_end'     or\
-            stack[0] == '$func_decl_end':
-            return head
+        if line[0] in _BlockEnd:
+            break
 
-        builder:ExecNodeBuilder
-        for builder in builderList:
+        builder: ExecNodeBuilder
+        builder = table.get(line[0])
+        if builder is None:
+            raise Exception(f'BuildExecNode():: unknown statement: {line}')
 
-            # Prev builder may drain all lines
-            if len(stack) <= 0:
-                break
+        node = builder.Run(stream)
 
-            node = builder.Run(stack)
+        if head is None:
+            head = node
+        else:
+            cur.next = node
+        cur = node
 
-            if node is not None:
-                if isinstance(head, EmptyNode):
-                    head = node
-                    cur = node
-                else:
-                    cur.next = node
-                    cur = node
+    if head is None:
+        head = EmptyNode(container)
     return head
     
 
 
 
 # Node builder produces a complete list of ExecNodes
-def BuildExecNode(source: str, container:ExecVarContainer) -> typing.Optional[ExecNode]:
-    stack = deque([x for x in source.splitlines() if x != ''])
-    return _BuildExecNode(stack, container)
-    
-    
-
-        
-
-
-
+def BuildExecNode(source: typing.Union[str, typing.Iterable[str]], container:ExecVarContainer, verbose= False) -> typing.Optional[ExecNode]:
+    """Build from IL source, either a string or an iterable of lines such as an open file"""
+    if isinstance(source, str):
+        source = source.splitlines()
+    return _BuildExecNode(LineStream(source, verbose), container, _MakeBuilderTable(container))
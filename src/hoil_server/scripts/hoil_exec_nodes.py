@@ -1,7 +1,10 @@
-from hoil_utils import EvaluateExpr, ExecVarContainer
-from hoil_dtypes import DType
+from hoil_utils import EvaluateExpr, ExecVarContainer, CompileExpr, CompiledExpr, FunctionMemo
+from hoil_dtypes import DType, Template
+from hoil_array import HoilArray
 import typing
 from copy import deepcopy
+import ast
+import re
 
 
 class ExecNode:
@@ -43,14 +46,18 @@ class DeclNode(ExecNode):
         # If true, assign value with AssignValue() instead of Assign(). Used for param decl in llm-based function calling
         self.directAssignment = directAssignment
 
+        self.slot = container.symbols.Resolve(spelling)
+
+        if self.expr is not None and not self.directAssignment:
+            self.expr = CompileExpr(self.expr, container.symbols)
+
     def __str__(self):
         return self.spelling.strip('%')
 
     def Run(self):
-        # TODO: Create different var types based on the supplied type
         var: DType
         # If paramdecl, it needs to be declared regardless (on the top stack)
-        var = self.container.varTable.Get(self.spelling, topLevelOnly= self.paramDecl)
+        var = self.container.varTable.GetSlot(self.slot, topLevelOnly= self.paramDecl)
         if var is not None:
             if self.directAssignment:
                 var.AssignValue(self.expr)
@@ -59,35 +66,47 @@ class DeclNode(ExecNode):
         else:
             dtype = DType(self.container, self.expr, directAssignment= self.directAssignment)
 
-            # If array, initialise dict
+            # If array, initialise an empty one
             if self.type == '$array' and self.expr is None:
-                dtype.AssignValue(dict())
+                dtype.AssignValue(HoilArray())
 
-            self.container.varTable.Insert(self.spelling, dtype)
+            self.container.varTable.InsertSlot(self.slot, dtype)
         
         return True
 
+    def Declare(self, val):
+        """Same as Run() but with an already evaluated value. Used by the bytecode VM"""
+        var: DType
+        var = self.container.varTable.GetSlot(self.slot, topLevelOnly= self.paramDecl)
+        if var is not None:
+            if not var.fixed:
+                var.AssignValue(val)
+        else:
+            self.container.varTable.InsertSlot(self.slot, DType(self.container, val, directAssignment= True))
+
     
 
 class InsertNode(ExecNode):
     """Variant of DeclNode, for inserting values in array."""
     def __init__(self, container: ExecVarContainer, ident: str, index:str, expr:str):
-        self.container = container
+        super().__init__(container)
         self.ident = ident
-        self.index = index
-        self.expr = expr
+        self.slot = container.symbols.Resolve(ident)
+        self.index = CompileExpr(index, container.symbols)
+        self.expr = CompileExpr(expr, container.symbols)
 
     def Run(self):
         index = EvaluateExpr(self.index, self.container)
         expr = EvaluateExpr(self.expr, self.container)
 
-        self.container.varTable.Get(self.ident).Get()[index] = expr
+        self.container.varTable.GetSlot(self.slot).Get()[index] = expr
+        return True
 
 
 class ExprNode(ExecNode):
     def __init__(self, container: ExecVarContainer, expr: str):
         super().__init__(container)
-        self.expr = expr
+        self.expr = CompileExpr(expr, container.symbols)
         self.value = None
 
     def Run(self):
@@ -173,7 +192,7 @@ class LoopNode(ExecNode):
 
     def Run(self):
         self.container.loopStack.append(self)
-        outcome = False
+        self.shouldBreak = False
         while True:
             if self.shouldBreak:
                 break
@@ -181,19 +200,22 @@ class LoopNode(ExecNode):
             self.condNode.Run()
 
             if self.condNode.value:
-                outcome = self.bodyNode.Run()
+                if not self.bodyNode.Run() and self.container.returning:
+                    # $return inside the loop, leave the function like the VM does
+                    self.container.loopStack.pop()
+                    return False
             else:
                 break
         
         self.container.loopStack.pop()
-        return outcome
+        return True
 
 class BreakNode(ExecNode):
     def __init__(self, container: ExecVarContainer):
         super().__init__(container)
 
     def Run(self):
-        self.container.loopStack[len(self.loopStack) - 1].shouldBreak = True
+        self.container.loopStack[len(self.container.loopStack) - 1].shouldBreak = True
         return False
     
 class ContinueNode(ExecNode):
@@ -210,11 +232,31 @@ class InstructNode(ExecNode):
         self.id = self.container.instructTable.Insert(stmt)
         self.value = None
 
+        # Translation lowered to native nodes, see LowerTranslation(). Built on the first run
+        self.lowered = None
+        self.lowerTried = False
+
     def Run(self):
-        python_code = self.container.instructTable.Get(self.id)
+        table = self.container.instructTable
+        code = table.GetCode(self.id)
+
+        if not self.lowerTried and table.lower:
+            self.lowerTried = True
+            self.lowered = LowerTranslation(table.Get(self.id), self.container)
+
+        if table.verbose:
+            print(f'Executing stmt: {table.Get(self.id)} ({self.stmt}){" (lowered)" if self.lowered is not None else ""}')
+
+        if self.lowered is None:
+            exec(code, table.globals, {'self': self})
+            return True
 
-        print(f'Executing stmt: {python_code} ({self.stmt})')
-        exec(python_code)
+        node = self.lowered
+        while node is not None:
+            node.Run()
+            if isinstance(node, ExprNode):
+                self.value = node.value
+            node = node.next
         return True
     
     # Used to declare variable
@@ -241,7 +283,11 @@ class InstructNode(ExecNode):
     
     # Call function (non-mangled spelling) with params
     def Call(self, spelling: str, args):
-        self.container.functionMap[f'%{spelling}%'].Call(args, directAssignment= True)
+        func = self.container.functionMap[f'%{spelling}%']
+        if isinstance(func, NativeFunction):
+            return func.Invoke(args)
+
+        func.Call(args, directAssignment= True)
         ret = None
 
         # If the function returns something, get the value
@@ -261,6 +307,14 @@ class FunctionNode(ExecNode):
         self.body = body
         self.paramNodes = param
 
+        # None until analysed on the first call. Natives are impure unless marked otherwise
+        self.pure = None
+        self.memo = None
+
+        # Slots observable through dynamic scoping. See FreeSlots()
+        self.freeSlots = None
+        self.freeSlotsKnown = False
+
         self.container.instructTable.InsertFunction(self)
 
     def __str__(self):
@@ -269,9 +323,72 @@ class FunctionNode(ExecNode):
         # Register function
     def Run(self):
         self.container.functionMap[self.ident] = self
+
+        # Analysis of callers depends on which function each name resolves to
+        for function in self.container.functionMap.values():
+            function._ResetAnalysis()
         return True
+
+    def IsNative(self) -> bool:
+        return isinstance(self.body, NativeNode)
+
+    def IsPure(self) -> bool:
+        if self.pure is None:
+            self.pure = _IsPureFunction(self, set())
+        return self.pure
+
+    def Memo(self) -> typing.Optional[FunctionMemo]:
+        """Memo of this function, if it is a pure HOIL function and memoization is enabled"""
+        if self.memo is None and self.container.memoize \
+            and not self.IsNative() and self.IsPure():
+            self.memo = FunctionMemo()
+        return self.memo
+
+    def MemoKey(self) -> typing.Optional[tuple]:
+        """Key for the params declared on top of the stack. Call after the params are set"""
+        args = []
+        for paramNode in self.paramNodes:
+            var = self.container.varTable.GetSlot(paramNode.slot, topLevelOnly= True)
+            if var is None:
+                return None
+            try:
+                args.append(var.Get())
+            except Exception:
+                return None
+        return self.memo.Key(args)
+
+    def FreeSlots(self) -> typing.Optional[frozenset]:
+        """
+        Slots other than its params that this function, or anything it calls, may read or write.
+        These are resolved through the caller's scopes (HOIL scoping is dynamic).
+        None if unknown, e.g. when instruct stmts run. Natives are assumed to only use their params.
+        """
+        if not self.freeSlotsKnown:
+            slots = set()
+            if _CollectSlots(self.body, self.container, slots, set([self])):
+                self.freeSlots = frozenset(slots - set(paramNode.slot for paramNode in self.paramNodes))
+            else:
+                self.freeSlots = None
+            self.freeSlotsKnown = True
+        return self.freeSlots
+
+    def _ResetAnalysis(self):
+        self.freeSlots = None
+        self.freeSlotsKnown = False
+
+        # Natives keep the purity they were registered with
+        if not self.IsNative():
+            self.pure = None
+            self.memo = None
     
     def Call(self, args, directAssignment= False):
+        # On the VM, calls from nodes run outside its program (e.g. lowered instruct stmts) go through
+        # its explicit frames too, so that deep recursion does not grow the Python stack
+        vm = self.container.vm
+        if vm is not None:
+            vm.Call(self, args if directAssignment else [EvaluateExpr(arg, self.container) for arg in args])
+            return
+
         prevFunc = self.container.currentFunc
         self.container.currentFunc = self
 
@@ -285,28 +402,292 @@ class FunctionNode(ExecNode):
                 self.paramNodes[i].expr = args[i]
                 self.paramNodes[i].Run()
 
-        self.body.Run()
+        memo = self.Memo()
+        key = None
+        if memo is not None:
+            key = self.MemoKey()
+
+        values = None
+        if key is not None:
+            values = memo.Get(key)
+
+        if values is not None:
+            self.container.returnVal.extend(values)
+        else:
+            depth = len(self.container.returnVal)
+            self.body.Run()
+            self.container.returning = False
+
+            if key is not None:
+                memo.Put(key, self.container.returnVal[depth:])
 
         self.container.currentFunc = prevFunc
         self.container.varTable.Pop()
 
-    def MakeFunction(container: ExecVarContainer, ident: str, param: list, body: ExecNode):
-        """Make function and return pointer, after inserting it to the table. feed list of non-mangled names in param"""
+    def Evaluate(self, args: list):
+        """Call with arg exprs and get the returned value"""
+        self.Call(args)
+        return self.container.returnVal.pop()
+
+    def MakeFunction(container: ExecVarContainer, ident: str, param: list, body: ExecNode, pure= False):
+        """Make function and return pointer, after inserting it to the table. feed list of non-mangled names in param.
+        Set pure if the native always returns the same value for the same args and has no side effects."""
         p = []
         for id in param:
             p.append(DeclNode(container= container, spelling= f'%{id}%', type= '', expr= None))
         f = FunctionNode(container, f'%{ident}%', p, body)
         f.Run()
+        f.pure = pure
         return f
 
+    @staticmethod
+    def MakeNative(container: ExecVarContainer, ident: str, param: list, func: typing.Callable, pure= False, withContainer= False):
+        """Same as MakeFunction(), for a Python callable taking the values of param and returning the value of the call.
+        With withContainer, func gets the container before them."""
+        p = []
+        for id in param:
+            p.append(DeclNode(container= container, spelling= f'%{id}%', type= '', expr= None))
+        f = NativeFunction(container, f'%{ident}%', p, func, withContainer)
+        f.Run()
+        f.pure = pure
+        return f
+
+
+class NativeFunction(FunctionNode):
+    """
+    Function implemented by a Python callable. It is called with the evaluated args and returns the value of
+    the call (None if there is none): no scope is pushed, no params are declared and the value does not go
+    through returnVal. paramNodes only describe the params, e.g. to the LLM.
+    """
+    def __init__(self, container: ExecVarContainer, ident: str, param: list, func: typing.Callable, withContainer= False):
+        super().__init__(container, ident, param, None)
+        self.func = func
+        self.withContainer = withContainer
+
+    def IsNative(self) -> bool:
+        return True
+
+    def FreeSlots(self) -> typing.Optional[frozenset]:
+        return frozenset()
+
+    def Invoke(self, values: list):
+        """Call func with already evaluated args. {var} in string args is interpolated in the caller's scope"""
+        args = []
+        for val in values:
+            if val.__class__ is str:
+                template = Template(val)
+                if template is not None:
+                    val = template.Render(self.container.varTable)
+            args.append(val)
+
+        if self.withContainer:
+            return self.func(self.container, *args)
+        return self.func(*args)
+
+    def Evaluate(self, args: list):
+        container = self.container
+        return self.Invoke([EvaluateExpr(args[i], container) for i in range(len(self.paramNodes))])
+
+    def Call(self, args, directAssignment= False):
+        """FunctionNode.Call() protocol, leaving the value on returnVal"""
+        val = self.Invoke(args) if directAssignment else self.Evaluate(args)
+        if val is not None:
+            self.container.returnVal.append(val)
+
+
+def MemoStats(container: ExecVarContainer) -> dict:
+    """Hit/miss counters of every memoized function, keyed by non-mangled name"""
+    return {str(function): function.memo.Stats() for function in container.functionMap.values() if function.memo is not None}
+
+
+def TemplateSlots(expr: CompiledExpr, container: ExecVarContainer) -> set:
+    """Slots of the {var} placeholders in the string literals of expr, read when the string is interpolated"""
+    slots = set()
+    for lex in expr.lexemes:
+        if lex.isLiteral and isinstance(lex.value, str):
+            template = Template(lex.value)
+            if template is not None:
+                slots.update(container.symbols.Resolve(name) for name in template.names)
+        elif lex.isFunc:
+            for arg in lex.value:
+                slots |= TemplateSlots(arg, container)
+        elif lex.isArr:
+            slots |= TemplateSlots(lex.value, container)
+    return slots
+
+
+def _CollectCallSlots(container: ExecVarContainer, ident: str, args: list, slots: set, visiting: set) -> bool:
+    for arg in args:
+        if not _CollectExprSlots(arg, container, slots, visiting):
+            return False
+
+    callee = container.functionMap.get(ident)
+    if callee is None:
+        return False
+    if callee in visiting:
+        return True
+
+    visiting.add(callee)
+    slots.update(paramNode.slot for paramNode in callee.paramNodes)
+    if callee.IsNative():
+        return True
+    return _CollectSlots(callee.body, container, slots, visiting)
+
+
+def _CollectExprSlots(expr: CompiledExpr, container: ExecVarContainer, slots: set, visiting: set) -> bool:
+    slots |= TemplateSlots(expr, container)
+    for lex in expr.lexemes:
+        if lex.isVar:
+            slots.add(lex.slot)
+        elif lex.isArr:
+            slots.add(lex.slot)
+            if not _CollectExprSlots(lex.value, container, slots, visiting):
+                return False
+        elif lex.isFunc and not _CollectCallSlots(container, lex.spelling, lex.value, slots, visiting):
+            return False
+    return True
+
+
+def _CollectSlots(node: ExecNode, container: ExecVarContainer, slots: set, visiting: set) -> bool:
+    """Add every slot the block and its callees may use to slots. False if it cannot be known"""
+    while node is not None:
+        exprs = []
+        if isinstance(node, DeclNode):
+            slots.add(node.slot)
+            if node.expr is not None and not node.directAssignment:
+                exprs.append(node.expr)
+        elif isinstance(node, InsertNode):
+            slots.add(node.slot)
+            exprs += [node.index, node.expr]
+        elif isinstance(node, ExprNode) or isinstance(node, ReturnNode):
+            if node.expr is not None:
+                exprs.append(node.expr)
+        elif isinstance(node, CallNode):
+            if not _CollectCallSlots(container, node.ident, node.args, slots, visiting):
+                return False
+        elif isinstance(node, ScopedNode):
+            if not _CollectSlots(node.node, container, slots, visiting):
+                return False
+        elif isinstance(node, BranchNode):
+            for cond in [node.ifNode] + node.elifNodes + [node.elseNode]:
+                if not _CollectSlots(cond, container, slots, visiting):
+                    return False
+        elif isinstance(node, ConditionalNode):
+            if not _CollectSlots(node.condNode, container, slots, visiting) or \
+                not _CollectSlots(node.execNode, container, slots, visiting):
+                return False
+        elif isinstance(node, LoopNode):
+            if not _CollectSlots(node.condNode, container, slots, visiting) or \
+                not _CollectSlots(node.bodyNode, container, slots, visiting):
+                return False
+        elif not (isinstance(node, EmptyNode) or isinstance(node, BreakNode) or isinstance(node, ContinueNode)):
+            # Instruct stmts can touch any variable, function declarations change the function map
+            return False
+
+        for expr in exprs:
+            if not _CollectExprSlots(expr, container, slots, visiting):
+                return False
+        node = node.next
+    return True
+
+
+def _IsPureFunction(func: FunctionNode, visiting: set) -> bool:
+    """
+    A HOIL function is pure if it only reads and writes its own params and only calls pure functions.
+    Any native node, instruct stmt, array insert or function declaration makes it impure.
+    Functions being analysed further up (recursion) are assumed pure.
+    """
+    if func.pure is not None:
+        return func.pure
+    if func in visiting:
+        return True
+    if func.IsNative():
+        return False
+
+    visiting.add(func)
+    params = set(paramNode.slot for paramNode in func.paramNodes)
+    pure = _IsPureBlock(func.body, func.container, params, visiting)
+    visiting.discard(func)
+    return pure
+
+
+def _IsPureCall(container: ExecVarContainer, ident: str, args: list, params: set, visiting: set) -> bool:
+    callee = container.functionMap.get(ident)
+    if callee is None or not _IsPureFunction(callee, visiting):
+        return False
+    return all(_IsPureExpr(arg, container, params, visiting) for arg in args)
+
+
+def _IsPureExpr(expr: CompiledExpr, container: ExecVarContainer, params: set, visiting: set) -> bool:
+    # A string passed on or assigned reads its {var} placeholders when interpolated
+    if not TemplateSlots(expr, container) <= params:
+        return False
+    for lex in expr.lexemes:
+        if lex.isVar and lex.slot not in params:
+            return False
+        if lex.isArr and (lex.slot not in params or not _IsPureExpr(lex.value, container, params, visiting)):
+            return False
+        if lex.isFunc and not _IsPureCall(container, lex.spelling, lex.value, params, visiting):
+            return False
+    return True
+
+
+def _IsPureBlock(node: ExecNode, container: ExecVarContainer, params: set, visiting: set) -> bool:
+    while node is not None:
+        if isinstance(node, DeclNode):
+            if node.slot not in params:
+                return False
+            if node.expr is not None and not _IsPureExpr(node.expr, container, params, visiting):
+                return False
+        elif isinstance(node, ExprNode) or isinstance(node, ReturnNode):
+            if node.expr is not None and not _IsPureExpr(node.expr, container, params, visiting):
+                return False
+        elif isinstance(node, CallNode):
+            if not _IsPureCall(container, node.ident, node.args, params, visiting):
+                return False
+        elif isinstance(node, ScopedNode):
+            if not _IsPureBlock(node.node, container, params, visiting):
+                return False
+        elif isinstance(node, BranchNode):
+            for cond in [node.ifNode] + node.elifNodes:
+                if isinstance(cond, ConditionalNode) and not _IsPureBlock(cond, container, params, visiting):
+                    return False
+            if not _IsPureBlock(node.elseNode, container, params, visiting):
+                return False
+        elif isinstance(node, ConditionalNode):
+            # Analysed on its own, without following .next
+            if not _IsPureBlock(node.condNode, container, params, visiting) or \
+                not _IsPureBlock(node.execNode, container, params, visiting):
+                return False
+        elif isinstance(node, LoopNode):
+            if not _IsPureBlock(node.condNode, container, params, visiting) or \
+                not _IsPureBlock(node.bodyNode, container, params, visiting):
+                return False
+        elif not (isinstance(node, EmptyNode) or isinstance(node, BreakNode) or isinstance(node, ContinueNode)):
+            # Instruct stmts, natives, inserts and nested function declarations
+            return False
+        node = node.next
+    return True
+
     
 class ReturnNode(ExecNode):
     def __init__(self, container: ExecVarContainer, expr: str):
         super().__init__(container)
-        self.expr = expr
+        self.expr = None
+
+        if expr != '':
+            self.expr = CompileExpr(expr, container.symbols)
     
     def Run(self):
-        if self.expr == '':
+        if self.container.currentFunc is None:
+            # Nothing to return from, the program goes on
+            if self.expr is not None:
+                EvaluateExpr(self.expr, self.container)
+            return True
+
+        # Tells the loops being left apart from $break and $continue
+        self.container.returning = True
+        if self.expr is None:
             return False
         
         self.container.returnVal.append(EvaluateExpr(self.expr, self.container))
@@ -317,11 +698,15 @@ class CallNode(ExecNode):
     def __init__(self, container: ExecVarContainer, ident: str, args: list):
         super().__init__(container)
         self.ident = ident
-        self.args = args
+        self.args = [CompileExpr(arg, container.symbols) for arg in args]
     
     def Run(self):
         func: FunctionNode
         func = self.container.functionMap[self.ident]
+        if isinstance(func, NativeFunction):
+            func.Evaluate(self.args)
+            return True
+
         func.Call(self.args)
 
         if len(self.container.returnVal) > 0:
@@ -329,7 +714,129 @@ class CallNode(ExecNode):
         return True
 
 
-        
-        
+_LowerBinOps = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'}
+_LowerCmpOps = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+_LowerBoolOps = {ast.And: '&&', ast.Or: '||'}
+_Identifier = re.compile(r'[A-Za-z_]\w*$')
+
+
+class _NotLowerable(Exception):
+    pass
 
 
+def LowerTranslation(code: str, container: ExecVarContainer) -> typing.Optional[ExecNode]:
+    """
+    Rewrite an instruct translation into a chain of native DeclNode/ExprNode/CallNode,
+    so it runs through CompileExpr and slot resolution like hand-written IL instead of exec().
+    Only numbers, bools, arithmetic, single comparisons and self.Decl/Assign/ValueOf/Call are lowered;
+    returns None for anything else (strings, %, not, chained comparisons...), which keeps running with exec().
+    """
+    try:
+        tree = ast.parse(code)
+        head = None
+        tail = None
+        for stmt in tree.body:
+            node = _LowerStmt(stmt, container)
+            if head is None:
+                head = node
+            else:
+                tail.next = node
+            tail = node
+        return head
+    except (_NotLowerable, SyntaxError):
+        return None
+
+
+def _AccessorCall(node: ast.AST, names: tuple) -> typing.Optional[ast.Call]:
+    """node if it is a call of one of the self.<name> accessors with a plain name as first argument"""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) \
+        and node.func.value.id == 'self' and node.func.attr in names and len(node.keywords) == 0 and len(node.args) > 0 \
+        and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str) and _Identifier.match(node.args[0].value):
+        return node
+    return None
+
+
+def _CallArgs(call: ast.Call) -> list:
+    if len(call.args) != 2 or not isinstance(call.args[1], (ast.List, ast.Tuple)):
+        raise _NotLowerable
+    return call.args[1].elts
+
+
+def _LowerStmt(stmt: ast.stmt, container: ExecVarContainer) -> ExecNode:
+    if isinstance(stmt, ast.Assign):
+        target = stmt.targets[0]
+        if len(stmt.targets) != 1 or not isinstance(target, ast.Attribute) or target.attr != 'value':
+            raise _NotLowerable
+        return ExprNode(container, _LowerExpr(stmt.value))
+
+    if not isinstance(stmt, ast.Expr):
+        raise _NotLowerable
+
+    decl = _AccessorCall(stmt.value, ('Decl', 'Assign'))
+    if decl is not None:
+        # Declaring without a value leaves the variable unassigned, which DeclNode cannot express
+        if len(decl.args) != 2:
+            raise _NotLowerable
+        return DeclNode(container, f'%{decl.args[0].value}%', '$real', _LowerExpr(decl.args[1]))
+
+    call = _AccessorCall(stmt.value, ('Call',))
+    if call is not None:
+        return CallNode(container, f'%{call.args[0].value}%', [_LowerExpr(arg) for arg in _CallArgs(call)])
+
+    raise _NotLowerable
+
+
+def _MayAct(node: ast.AST) -> bool:
+    """Whether evaluating node may have a side effect or raise"""
+    return isinstance(node, (ast.Call, ast.Subscript)) or \
+        (isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Div, ast.Mod, ast.FloorDiv)))
+
+
+def _LowerExpr(node: ast.expr) -> str:
+    """HOIL IL spelling of a Python expression"""
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool):
+            return 'true' if node.value else 'false'
+        if isinstance(node.value, (int, float)):
+            return repr(node.value)
+        raise _NotLowerable
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        if isinstance(node.operand, ast.Constant) and type(node.operand.value) in (int, float):
+            return repr(-node.operand.value)
+        return f'{_LowerExpr(node.operand)};['
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _LowerBinOps:
+        return f'{_LowerExpr(node.left)};{_LowerExpr(node.right)};{_LowerBinOps[type(node.op)]}'
+
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _LowerCmpOps:
+        return f'{_LowerExpr(node.left)};{_LowerExpr(node.comparators[0])};{_LowerCmpOps[type(node.ops[0])]}'
+
+    if isinstance(node, ast.BoolOp) and type(node.op) in _LowerBoolOps:
+        # HOIL evaluates every operand while Python stops at the first deciding one. Only lower when
+        # running the others cannot be observed: no calls, which may have side effects, and nothing that
+        # may raise (lookups of possibly undeclared variables, indexing, division)
+        if any(_MayAct(child) for value in node.values[1 :] for child in ast.walk(value)):
+            raise _NotLowerable
+        values = [_LowerExpr(value) for value in node.values]
+        op = _LowerBoolOps[type(node.op)]
+        return ';'.join([values[0]] + [f'{value};{op}' for value in values[1:]])
+
+    if isinstance(node, ast.Subscript):
+        var = _AccessorCall(node.value, ('ValueOf',))
+        index = _LowerExpr(node.slice)
+        # The IL array syntax ends the index at the first $
+        if var is None or len(var.args) != 1 or '$' in index:
+            raise _NotLowerable
+        return f'$a,%{var.args[0].value}%,{index}$^'
+
+    var = _AccessorCall(node, ('ValueOf',))
+    if var is not None and len(var.args) == 1:
+        return f'%{var.args[0].value}%'
+
+    call = _AccessorCall(node, ('Call',))
+    if call is not None:
+        args = [_LowerExpr(arg) for arg in _CallArgs(call)]
+        return f'$,%{call.args[0].value}%,{",".join(args)}$^'
+
+    raise _NotLowerable
@@ -0,0 +1,127 @@
+import re
+import typing
+
+
+# Operand: a number, true/false, or a variable written as {x}. A bare word after 'is' is too
+# often an adjective ("If the gripper is open") to be taken for a variable
+_Operand = r'-?\d+(?:\.\d+)?|true|false|\{\s*[A-Za-z_]\w*\s*\}'
+_Val = rf'(?P<val>{_Operand})'
+_Var = r'\{?\s*(?P<var>[A-Za-z_]\w*)\s*\}?'
+
+# Comparison phrases, longest first so 'less than or equal to' wins over 'less than'
+_Comparisons = [
+    (r'is less than or equal to|is smaller than or equal to|is at most|is not greater than|is not more than', '<='),
+    (r'is greater than or equal to|is bigger than or equal to|is larger than or equal to|is at least|is not less than|is not smaller than', '>='),
+    (r'is less than|is smaller than|is below|is lower than', '<'),
+    (r'is greater than|is bigger than|is larger than|is more than|is above|is higher than', '>'),
+    (r'is not equal to|is not|does not equal|is different from|!=', '!='),
+    (r'is equal to|equals|is|==', '=='),
+]
+
+_Conditions = [ (re.compile(rf'(?:(?:if|while|when|whether)\s+)?{_Var}\s+(?:{phrases})\s+{_Val}', re.IGNORECASE), op)
+                for phrases, op in _Comparisons ]
+_Until = re.compile(r'until\s+(.*)', re.IGNORECASE)
+
+# Assignments as (pattern, code). {var} and {val} are filled in from the named groups
+_Assignments = [ (re.compile(pattern, re.IGNORECASE), code) for pattern, code in [
+    (rf'(?:increment|increase)\s+{_Var}\s+by\s+{_Val}', "self.Assign('{var}', self.ValueOf('{var}') + {val})"),
+    (rf'(?:decrement|decrease)\s+{_Var}\s+by\s+{_Val}', "self.Assign('{var}', self.ValueOf('{var}') - {val})"),
+    (rf'add\s+{_Val}\s+to\s+{_Var}', "self.Assign('{var}', self.ValueOf('{var}') + {val})"),
+    (rf'subtract\s+{_Val}\s+from\s+{_Var}', "self.Assign('{var}', self.ValueOf('{var}') - {val})"),
+    (rf'multiply\s+{_Var}\s+by\s+{_Val}', "self.Assign('{var}', self.ValueOf('{var}') * {val})"),
+    (rf'divide\s+{_Var}\s+by\s+{_Val}', "self.Assign('{var}', self.ValueOf('{var}') / {val})"),
+    (rf'(?:increment|increase)\s+{_Var}', "self.Assign('{var}', self.ValueOf('{var}') + 1)"),
+    (rf'(?:decrement|decrease)\s+{_Var}', "self.Assign('{var}', self.ValueOf('{var}') - 1)"),
+    (rf'(?:set|change)\s+{_Var}\s+to\s+{_Val}', "self.Assign('{var}', {val})"),
+    (rf'let\s+{_Var}\s+be\s+{_Val}', "self.Decl('{var}', {val})"),
+    (rf'assign\s+{_Val}\s+to\s+{_Var}', "self.Assign('{var}', {val})"),
+    (rf'(?:declare|create)\s+{_Var}\s+(?:as|with value|equal to)\s+{_Val}', "self.Decl('{var}', {val})"),
+    (rf'(?:declare|create)\s+{_Var}', "self.Decl('{var}')"),
+]]
+
+_Call = re.compile(rf'call\s+([A-Za-z_]\w*)(?:\s+with\s+(.*))?', re.IGNORECASE)
+_Separator = re.compile(r'\s*,\s*(?:and\s+)?|\s+and\s+', re.IGNORECASE)
+
+
+def _Strip(stmt: str) -> str:
+    """Drop the surrounding quotes, trailing punctuation and repeated whitespace"""
+    s = stmt.strip()
+    if len(s) >= 2 and s[0] == s[-1] == '"':
+        s = s[1:-1]
+    s = ' '.join(s.split())
+    return s.rstrip('.!?;: ')
+
+
+def _Value(operand: str) -> str:
+    """Python expression of an operand"""
+    operand = operand.strip()
+    if re.fullmatch(r'-?\d+(?:\.\d+)?', operand):
+        return operand
+    if operand.lower() in ('true', 'false'):
+        return operand.capitalize()
+
+    name = operand.strip('{} ')
+    return f"self.ValueOf('{name}')"
+
+
+class LocalTranslator:
+    """
+    Translates instruct stmts of common shapes without the LLM, producing the code
+    the prompt in gpt_prompt.py asks for. Arithmetic updates ("Increment x by 5"),
+    assignments ("Set x to 3"), comparisons ("If x is 5", "while x is less than 10",
+    "until x is 3") and calls of known functions ("Call Release").
+    Translate() returns None for anything else.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def Translate(self, stmt: str, functions: typing.Iterable = ()) -> typing.Optional[str]:
+        """functions: non-mangled names of the functions a stmt may call"""
+        code = self._Translate(_Strip(stmt), set(functions))
+        if code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return code
+
+    def Stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hitRate': self.hits / total if total > 0 else 0.0}
+
+    def _Translate(self, s: str, functions: set) -> typing.Optional[str]:
+        for pattern, code in _Assignments:
+            match = pattern.fullmatch(s)
+            if match is None:
+                continue
+
+            groups = match.groupdict()
+            if 'val' in groups:
+                groups['val'] = _Value(groups['val'])
+            return code.format(**groups)
+
+        until = _Until.fullmatch(s)
+        if until is not None:
+            cond = self._Condition(until.group(1))
+            return None if cond is None else f'self.value = not ({cond})'
+
+        cond = self._Condition(s)
+        if cond is not None:
+            return f'self.value = {cond}'
+
+        call = _Call.fullmatch(s)
+        if call is None and s in functions:
+            return f"self.Call('{s}', [])"
+        if call is not None and call.group(1) in functions:
+            args = [] if call.group(2) is None else _Separator.split(call.group(2))
+            if not all(re.fullmatch(_Operand, arg, re.IGNORECASE) for arg in args):
+                return None
+            return f"self.Call('{call.group(1)}', [{', '.join(map(_Value, args))}])"
+        return None
+
+    def _Condition(self, s: str) -> typing.Optional[str]:
+        for pattern, op in _Conditions:
+            match = pattern.fullmatch(s)
+            if match is not None:
+                return f"self.ValueOf('{match.group('var')}') {op} {_Value(match.group('val'))}"
+        return None
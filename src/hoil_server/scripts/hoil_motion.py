@@ -0,0 +1,177 @@
+from concurrent.futures import Future
+import queue
+import threading
+import typing
+
+
+class MotionCommand:
+    """One queued arm operation: a callable, its args and the future completed when it has run.
+    followers are the futures of the buffered motions the command stands for, completed along with it"""
+    def __init__(self, name: str, func: typing.Callable, args: tuple, followers: list = None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.future = Future()
+        self.followers = [] if followers is None else followers
+
+    def __str__(self):
+        return f'{self.name}{self.args}'
+
+
+class MotionQueue:
+    """
+    Runs arm commands in order on a worker thread, so the interpreter keeps going while the arm moves.
+    MoveTo(), MoveBy(), OpenGripper(), CloseGripper() and Submit() return immediately with a future.
+    Sync() blocks until everything queued so far has run and raises the first failure.
+    Once a command fails, the commands queued after it are not run and fail with the same error, until Sync().
+    With asynchronous= False every command runs before the call returns, as if there were no queue.
+
+    With coalesce, consecutive MoveTo/MoveBy are buffered until the next sync point (Sync(), any other
+    command, or maxWaypoints motions) and sent to the arm as one MoveAlong() path.
+    """
+    def __init__(self, arm, asynchronous= True, maxPending= 16, coalesce= True, maxWaypoints= 32):
+        self.arm = arm
+        self.asynchronous = asynchronous
+        self.coalesce = coalesce
+        self.maxWaypoints = maxWaypoints
+        self._queue = queue.Queue(maxsize= maxPending)
+        self._futures = []
+        self._path = []
+        self._error = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def MoveTo(self, x, y, z) -> Future:
+        if self._Buffering():
+            return self._Buffer(False, x, y, z)
+        return self.Submit('MoveTo', self.arm.MoveTo, x, y, z)
+
+    def MoveBy(self, x, y, z) -> Future:
+        if self._Buffering():
+            return self._Buffer(True, x, y, z)
+        return self.Submit('MoveBy', self.arm.MoveBy, x, y, z)
+
+    def OpenGripper(self) -> Future:
+        return self.Submit('OpenGripper', self.arm.OpenGripper)
+
+    def CloseGripper(self) -> Future:
+        return self.Submit('CloseGripper', self.arm.CloseGripper)
+
+    def Submit(self, name: str, func: typing.Callable, *args) -> Future:
+        """Queue func(*args) behind the commands already queued. Blocks while maxPending commands are waiting"""
+        self.Flush()
+        command = MotionCommand(name, func, args)
+        with self._lock:
+            self._futures.append(command.future)
+        self._Enqueue(command)
+        return command.future
+
+    def Flush(self):
+        """Send the buffered motions to the arm, as a single path if there are several"""
+        path = self._path
+        if len(path) == 0:
+            return
+        self._path = []
+
+        if len(path) == 1:
+            relative, x, y, z, future = path[0]
+            command = MotionCommand('MoveBy' if relative else 'MoveTo', self.arm.MoveBy if relative else self.arm.MoveTo,
+                                    (x, y, z), [future])
+        else:
+            moves = [(relative, x, y, z) for relative, x, y, z, _ in path]
+            command = MotionCommand('MoveAlong', self.arm.MoveAlong, (moves,), [future for *_, future in path])
+        self._Enqueue(command)
+
+    def _Buffering(self) -> bool:
+        return self.coalesce and self.asynchronous and hasattr(self.arm, 'MoveAlong')
+
+    def _Buffer(self, relative: bool, x, y, z) -> Future:
+        future = Future()
+        with self._lock:
+            self._futures.append(future)
+        self._path.append((relative, x, y, z, future))
+
+        if len(self._path) >= self.maxWaypoints:
+            self.Flush()
+        return future
+
+    def _Enqueue(self, command: MotionCommand):
+        if not self.asynchronous:
+            self._Run(command)
+            self.Sync()
+            return
+
+        self._StartWorker()
+        self._queue.put(command)
+
+    def Sync(self, timeout= None):
+        """Wait for every queued command. Raise the first error since the last Sync()"""
+        self.Flush()
+        with self._lock:
+            futures = self._futures
+            self._futures = []
+
+        for future in futures:
+            future.exception(timeout= timeout)
+
+        with self._lock:
+            error = self._error
+            self._error = None
+        if error is not None:
+            raise error
+
+    def Pending(self) -> int:
+        """Number of commands submitted and not finished yet"""
+        with self._lock:
+            return len([future for future in self._futures if not future.done()])
+
+    def Close(self):
+        """Finish the queued commands and stop the worker"""
+        self.Flush()
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def _StartWorker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target= self._Work, name= 'MotionQueue', daemon= True)
+            self._worker.start()
+
+    def _Work(self):
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+            self._Run(command)
+
+    def _Run(self, command: MotionCommand):
+        if not command.future.set_running_or_notify_cancel():
+            return
+
+        # Later commands assume the earlier ones succeeded, e.g. MoveBy after MoveTo
+        with self._lock:
+            error = self._error
+        if error is not None:
+            self._Fail(command, error)
+            return
+
+        try:
+            res = command.func(*command.args)
+        except Exception as e:
+            print(f'MotionQueue:: {command} failed: ')
+            print(e)
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._Fail(command, e)
+            return
+
+        command.future.set_result(res)
+        for future in command.followers:
+            future.set_result(res)
+
+    def _Fail(self, command: MotionCommand, error: Exception):
+        command.future.set_exception(error)
+        for future in command.followers:
+            future.set_exception(error)
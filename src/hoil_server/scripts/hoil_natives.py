@@ -0,0 +1,96 @@
+from collections import OrderedDict
+import importlib
+import inspect
+import os
+import typing
+
+from hoil_utils import ExecVarContainer
+from hoil_exec_nodes import FunctionNode
+from hoil_array import HoilArray, Elements, ArrayOf, ARRAY_NATIVES
+
+
+NATIVES_ENV = 'HOIL_NATIVES'
+
+
+class NativeSpec:
+    """
+    A native function taking and returning HOIL values, e.g. whole arrays.
+    With withContainer, func gets the ExecVarContainer before the HOIL args.
+    """
+    def __init__(self, name: str, params: list, func: typing.Callable, pure= False, withContainer= False):
+        self.name = name
+        self.params = params
+        self.func = func
+        self.pure = pure
+        self.withContainer = withContainer
+
+
+# Name -> NativeSpec of every registered native, in registration order
+_Registry = OrderedDict()
+
+
+def RegisterNative(spec: NativeSpec):
+    if spec.name in _Registry and _Registry[spec.name].func is not spec.func:
+        print(f'Natives:: {spec.name} redefined')
+    _Registry[spec.name] = spec
+
+
+def Native(name: str = None, pure= False, withContainer= False) -> typing.Callable:
+    """
+    Decorator registering a Python function as a HOIL native, named after the function unless name is given.
+    Its parameters become the HOIL params. Set pure if it always returns the same value for the same args
+    and has no side effects.
+    """
+    def Register(func: typing.Callable) -> typing.Callable:
+        params = list(inspect.signature(func).parameters)
+        if withContainer:
+            params = params[1 :]
+        RegisterNative(NativeSpec(func.__name__ if name is None else name, params, func, pure, withContainer))
+        return func
+    return Register
+
+
+def Natives() -> list:
+    return list(_Registry.values())
+
+
+def LoadNativeModules(modules: typing.Iterable = None):
+    """
+    Import the modules defining natives with @Native. modules defaults to the comma separated
+    module names in $HOIL_NATIVES, so natives can be added without editing server.py.
+    """
+    if modules is None:
+        modules = os.environ.get(NATIVES_ENV, '').split(',')
+
+    for module in modules:
+        module = module.strip()
+        if module != '':
+            importlib.import_module(module)
+
+
+def InstallNatives(container: ExecVarContainer):
+    """Make every registered native callable from HOIL in container"""
+    for spec in _Registry.values():
+        FunctionNode.MakeNative(container, spec.name, spec.params, spec.func, spec.pure, spec.withContainer)
+
+
+for _name, _params, _func in ARRAY_NATIVES:
+    RegisterNative(NativeSpec(_name, _params, _func, pure= True))
+
+
+# Batch scene queries: one call over an array of scene objects instead of a HOIL loop of HeightOf/PositionOf
+
+@Native(pure= True)
+def HeightsOf(objs):
+    """Heights of the scene objects in objs, at the same indices"""
+    indices, values = Elements(objs)
+    return ArrayOf(indices, [obj.height for obj in values])
+
+
+@Native(withContainer= True)
+def PositionsOf(container: ExecVarContainer, objs):
+    """[x, y, z] of the scene objects in objs, at the same indices"""
+    container.SyncMotion()
+
+    indices, values = Elements(objs)
+    return ArrayOf(indices, [HoilArray([obj.x, obj.y, obj.z]) for obj in values])
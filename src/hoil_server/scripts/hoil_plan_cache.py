@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import threading
+import typing
+
+
+class Planner:
+    """
+    Motion planner of an arm, split into planning and execution so plans can be reused.
+    A target is a tuple of floats (x, y, z, qx, qy, qz, qw for a pose). Override every method.
+    """
+    def CurrentJoints(self) -> tuple:
+        """Joint values the next plan starts from"""
+        raise NotImplementedError
+
+    def SceneRevision(self) -> int:
+        """Changes whenever the planning scene changes, e.g. an object is attached"""
+        raise NotImplementedError
+
+    def Plan(self, target: tuple) -> typing.Optional[object]:
+        """Plan a trajectory from the current joints to target. None if planning failed"""
+        raise NotImplementedError
+
+    def Execute(self, trajectory, wait= True):
+        raise NotImplementedError
+
+
+def Quantize(values: tuple, step: float) -> tuple:
+    return tuple(int(round(v / step)) for v in values)
+
+
+class PlanCache:
+    """
+    Bounded LRU cache of trajectories keyed by the quantized start joints and target.
+    An entry only holds for the scene revision it was planned in; entries of older revisions are dropped on lookup.
+    """
+    def __init__(self, maxSize= 256, jointStep= 0.001, targetStep= 0.001):
+        self.maxSize = maxSize
+        self.jointStep = jointStep
+        self.targetStep = targetStep
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self._table = OrderedDict()
+        self._lock = threading.Lock()
+
+    def Key(self, joints: tuple, target: tuple) -> tuple:
+        return (Quantize(joints, self.jointStep), Quantize(target, self.targetStep))
+
+    def Get(self, key: tuple, revision) -> typing.Optional[object]:
+        with self._lock:
+            entry = self._table.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] != revision:
+                del self._table[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+
+            self._table.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def Put(self, key: tuple, revision, trajectory):
+        with self._lock:
+            self._table[key] = (revision, trajectory)
+            self._table.move_to_end(key)
+            while len(self._table) > self.maxSize:
+                self._table.popitem(last= False)
+                self.evictions += 1
+
+    def Evict(self, key: tuple):
+        """Drop the entry at key, e.g. a trajectory that failed to execute"""
+        with self._lock:
+            self._table.pop(key, None)
+
+    def Clear(self):
+        with self._lock:
+            self._table.clear()
+
+    def Stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hitRate': self.hits / total if total > 0 else 0.0,
+                'stale': self.stale, 'evictions': self.evictions, 'size': len(self._table)}
+
+
+class CachedPlanner(Planner):
+    """Planner reusing the trajectories of planner from cache. A trajectory that fails to execute is evicted"""
+    def __init__(self, planner: Planner, cache: PlanCache = None):
+        self.planner = planner
+        self.cache = PlanCache() if cache is None else cache
+
+        # Key of the last trajectory handed out, to evict it if it fails
+        self._planned = None
+
+    def CurrentJoints(self) -> tuple:
+        return self.planner.CurrentJoints()
+
+    def SceneRevision(self) -> int:
+        return self.planner.SceneRevision()
+
+    def Plan(self, target: tuple) -> typing.Optional[object]:
+        key = self.cache.Key(self.planner.CurrentJoints(), target)
+        revision = self.planner.SceneRevision()
+
+        trajectory = self.cache.Get(key, revision)
+        if trajectory is None:
+            trajectory = self.planner.Plan(target)
+            if trajectory is not None:
+                self.cache.Put(key, revision, trajectory)
+
+        self._planned = (key, trajectory)
+        return trajectory
+
+    def Execute(self, trajectory, wait= True):
+        success = self.planner.Execute(trajectory, wait)
+        planned = self._planned
+        if success is False and planned is not None and planned[1] is trajectory:
+            self.cache.Evict(planned[0])
+            self._planned = None
+        return success
@@ -0,0 +1,182 @@
+from hoil_utils import ExecVarContainer
+from hoil_exec_nodes import ExecNode
+from hoil_exec_node_builder import BuildExecNode
+import hashlib
+import os
+import pickle
+import sys
+import typing
+
+
+# The cache is a pickle, and loading a pickle runs whatever code it names.
+# It is therefore kept in a directory of the user's own rather than next to the IL file,
+# where anyone able to write to the program's directory could plant one.
+CACHE_ENV = 'HOIL_PROGRAM_CACHE'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.hoil', 'programs')
+CACHE_SUFFIX = '.hoilc'
+
+# Modules whose classes end up in the pickled node graph
+_NODE_MODULES = ['hoil_utils', 'hoil_exec_nodes', 'hoil_exec_node_builder', 'hoil_dtypes', 'hoil_array', __name__]
+
+_MAGIC = 'hoil-compiled-program'
+
+
+def _SourceVersion() -> str:
+    """Hash of the node module sources, so that any change to what gets pickled invalidates old caches"""
+    h = hashlib.sha256()
+    for name in _NODE_MODULES:
+        with open(sys.modules[name].__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+CACHE_VERSION = _SourceVersion()
+
+
+def _NewNode(cls):
+    return cls.__new__(cls)
+
+
+class _ProgramPickler(pickle.Pickler):
+    """
+    Pickles the node graph with the container replaced by a placeholder.
+    .next links are cut and written afterwards in flat batches, so that
+    long statement lists do not turn into deep pickle recursion.
+    """
+    def __init__(self, file, container: ExecVarContainer):
+        super().__init__(file, protocol= pickle.HIGHEST_PROTOCOL)
+        self.container = container
+        self.links = []
+
+    def persistent_id(self, obj):
+        if obj is self.container:
+            return 'container'
+        return None
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, ExecNode):
+            return NotImplemented
+
+        state = obj.__dict__.copy()
+        nextNode = state.get('next')
+        state['next'] = None
+        if nextNode is not None:
+            self.links.append((obj, nextNode))
+        return (_NewNode, (type(obj),), state)
+
+
+class _ProgramUnpickler(pickle.Unpickler):
+    def __init__(self, file, container: ExecVarContainer):
+        super().__init__(file)
+        self.container = container
+
+    def persistent_load(self, pid):
+        if pid == 'container':
+            return self.container
+        raise pickle.UnpicklingError(f'Unknown persistent id {pid}')
+
+
+def CacheDir() -> str:
+    return os.environ.get(CACHE_ENV, DEFAULT_CACHE_DIR)
+
+
+def CachePath(path: str) -> str:
+    """Location of the compiled cache of the IL program at path, in CacheDir() and named after its absolute path"""
+    key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[: 16]
+    return os.path.join(CacheDir(), f'{os.path.basename(path)}.{key}{CACHE_SUFFIX}')
+
+
+def _Header(digest: str) -> dict:
+    return {
+        'magic': _MAGIC,
+        'version': CACHE_VERSION,
+        'python': tuple(sys.version_info[:2]),
+        'hash': digest,
+    }
+
+
+def SaveProgram(path: str, digest: str, node: ExecNode, container: ExecVarContainer):
+    """Write the freshly built program to the cache. Call before anything else is inserted into container."""
+    cachePath = CachePath(path)
+    tmpPath = f'{cachePath}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cachePath), mode= 0o700, exist_ok= True)
+        with open(tmpPath, 'wb') as f:
+            pickler = _ProgramPickler(f, container)
+            pickler.dump(_Header(digest))
+            pickler.dump({
+                'node': node,
+                'symbols': container.symbols.Names(),
+                'functions': container.instructTable.Functions(),
+                'instructs': container.instructTable.Statements(),
+            })
+
+            while len(pickler.links) > 0:
+                links = pickler.links
+                pickler.links = []
+                pickler.dump(links)
+            pickler.dump(None)
+
+        os.replace(tmpPath, cachePath)
+    except Exception as e:
+        print(f'ProgramCache:: Could not write {cachePath}: ')
+        print(e)
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def LoadProgram(path: str, digest: str, container: ExecVarContainer) -> typing.Optional[ExecNode]:
+    """Load the cached program matching digest into a fresh container. Return None on a miss."""
+    cachePath = CachePath(path)
+    if not os.path.exists(cachePath):
+        return None
+
+    # Slots and instruct ids are only valid in a container that has not been used yet
+    if len(container.symbols) > 0 or len(container.instructTable.Statements()) > 0 \
+        or len(container.instructTable.Functions()) > 0:
+        return None
+
+    try:
+        with open(cachePath, 'rb') as f:
+            unpickler = _ProgramUnpickler(f, container)
+            if unpickler.load() != _Header(digest):
+                return None
+
+            payload = unpickler.load()
+            while True:
+                links = unpickler.load()
+                if links is None:
+                    break
+                for node, nextNode in links:
+                    node.next = nextNode
+    except Exception as e:
+        print(f'ProgramCache:: Could not read {cachePath}: ')
+        print(e)
+        return None
+
+    for name in payload['symbols']:
+        container.symbols.Resolve(name)
+    for function in payload['functions']:
+        container.instructTable.InsertFunction(function)
+    for stmt in payload['instructs']:
+        container.instructTable.Insert(stmt)
+
+    return payload['node']
+
+
+def BuildCachedProgram(path: str, container: ExecVarContainer, verbose= False) -> typing.Optional[ExecNode]:
+    """
+    BuildExecNode() for the IL file at path, reusing the compiled program cached in CacheDir()
+    when the source hash matches. Rebuilds and rewrites the cache otherwise.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    node = LoadProgram(path, digest, container)
+    if node is not None:
+        return node
+
+    node = BuildExecNode(data.decode('utf-8'), container, verbose= verbose)
+    SaveProgram(path, digest, node, container)
+    return node
@@ -0,0 +1,183 @@
+import ast
+import re
+import typing
+
+
+_VarRef = re.compile(r'\{\s*([A-Za-z_]\w*)\s*\}')
+_Number = re.compile(r'\d+(?:\.\d+)?')
+_Punct = re.compile(r'[,;:!?"\'`]|\.(?!\d)')
+_Identifier = re.compile(r'[A-Za-z_]\w*$')
+_Word = re.compile(r'\w+')
+_Placeholder = re.compile(r'\{\d+\}')
+
+# Words that flip the meaning of a stmt. Contractions are split at the apostrophe by CanonicalStmt
+_Negations = frozenset(['not', 'no', 'never', 'neither', 'nor', 'none', 'nothing', 'cannot', 't',
+                        'isn', 'aren', 'wasn', 'weren', 'doesn', 'don', 'didn', 'won', 'hasn', 'haven', 'hadn',
+                        'shouldn', 'couldn', 'wouldn'])
+
+
+def CanonicalStmt(stmt: str) -> tuple:
+    """
+    Canonical form of an instruct stmt and the {var} references it makes.
+    Quotes, case, sentence punctuation and whitespace are dropped, and the n-th distinct
+    {var} becomes the placeholder {n}, e.g. '"Set {pos} to {Cube}."' -> ('set {0} to {1}', ['pos', 'Cube'])
+    """
+    s = stmt.strip()
+    if len(s) >= 2 and s[0] == s[-1] == '"':
+        s = s[1:-1]
+
+    names = []
+    def Placeholder(match: re.Match) -> str:
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return '{%d}' % names.index(name)
+
+    s = _VarRef.sub(Placeholder, s)
+    s = _Punct.sub(' ', s.lower())
+    return ' '.join(s.split()), names
+
+
+def ContentWords(template: str) -> frozenset:
+    """Words of a canonical stmt, without its placeholders and numbers"""
+    return frozenset(word for word in _Word.findall(_Placeholder.sub(' ', _Number.sub(' ', template))))
+
+
+def _Grams(template: str, n= 3) -> frozenset:
+    padded = f' {template} '
+    return frozenset(padded[i : i + n] for i in range(max(1, len(padded) - n + 1)))
+
+
+def _CodeNames(tree: ast.AST) -> set:
+    """Variable names a translation refers to: identifier-like strings, except the function name of self.Call"""
+    skip = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'Call' \
+            and len(node.args) > 0:
+            skip.add(id(node.args[0]))
+
+    return set(node.value for node in ast.walk(tree)
+               if isinstance(node, ast.Constant) and isinstance(node.value, str)
+               and id(node) not in skip and _Identifier.match(node.value))
+
+
+def RemapCode(code: str, mapping: dict) -> str:
+    """Rename the variables a translation refers to. mapping: old name -> new name"""
+    mapping = { old: new for old, new in mapping.items() if old != new }
+    if len(mapping) == 0:
+        return code
+
+    tree = ast.parse(code)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in mapping:
+            node.value = mapping[node.value]
+    return ast.unparse(tree)
+
+
+class _Entry:
+    def __init__(self, stmt: str, code: str):
+        self.stmt = stmt
+        self.code = code
+        self.template, self.names = CanonicalStmt(stmt)
+        self.numbers = _Number.findall(self.template)
+        self.words = ContentWords(self.template)
+        self.grams = _Grams(self.template)
+        self.codeNames = _CodeNames(ast.parse(code))
+
+
+class NearHit:
+    """A cached stmt close to a looked-up one, kept for review"""
+    def __init__(self, stmt: str, cachedStmt: str, score: float, accepted: bool, reason: str = ''):
+        self.stmt = stmt
+        self.cachedStmt = cachedStmt
+        self.score = score
+        self.accepted = accepted
+        self.reason = reason
+
+    def __str__(self):
+        verdict = 'used' if self.accepted else f'rejected, {self.reason}' if self.reason else 'below threshold'
+        return f'{self.stmt} ~ {self.cachedStmt} ({self.score:.2f}, {verdict})'
+
+
+class StmtIndex:
+    """
+    Local character n-gram index over translated stmts.
+    Lookup() returns the translation of the most similar stmt when its Dice similarity
+    reaches threshold, both stmts have the same numbers and the same content words (so "increment"
+    never stands in for "decrement", nor "is less than" for "is not less than") and every variable
+    its code touches is mentioned by the new stmt. {var} references are matched by position and
+    renamed in the returned code.
+    Candidates scoring at least nearThreshold are recorded in nearHits.
+    """
+    def __init__(self, threshold= 0.9, nearThreshold= 0.7):
+        self.threshold = threshold
+        self.nearThreshold = nearThreshold
+        self.nearHits = []
+        self._entries = []
+        self._postings = dict()
+
+    def Add(self, stmt: str, code: str):
+        try:
+            entry = _Entry(stmt, code)
+        except SyntaxError:
+            return
+
+        index = len(self._entries)
+        self._entries.append(entry)
+        for gram in entry.grams:
+            self._postings.setdefault(gram, []).append(index)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def Lookup(self, stmt: str) -> typing.Optional[str]:
+        template, names = CanonicalStmt(stmt)
+        grams = _Grams(template)
+
+        shared = dict()
+        for gram in grams:
+            for index in self._postings.get(gram, ()):
+                shared[index] = shared.get(index, 0) + 1
+
+        scored = []
+        for index, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._entries[index].grams))
+            if score >= self.nearThreshold:
+                scored.append((score, index))
+        scored.sort(key= lambda pair: (-pair[0], pair[1]))
+
+        numbers = _Number.findall(template)
+        content = ContentWords(template)
+        words = set(_Word.findall(stmt))
+        for score, index in scored:
+            entry = self._entries[index]
+            if score < self.threshold:
+                self.nearHits.append(NearHit(stmt, entry.stmt, score, False))
+                break
+
+            reason = self._Mismatch(entry, numbers, content, names, words)
+            if reason:
+                self.nearHits.append(NearHit(stmt, entry.stmt, score, False, reason))
+                continue
+
+            if entry.stmt != stmt:
+                self.nearHits.append(NearHit(stmt, entry.stmt, score, True))
+            return RemapCode(entry.code, dict(zip(entry.names, names)))
+        return None
+
+    def _Mismatch(self, entry: _Entry, numbers: list, content: frozenset, names: list, words: set) -> str:
+        """Why entry cannot stand in for the looked-up stmt, or '' if it can"""
+        if entry.numbers != numbers:
+            return 'numbers differ'
+        if (entry.words & _Negations) != (content & _Negations):
+            return 'negation differs'
+        if entry.words != content:
+            return 'words differ'
+        if len(entry.names) != len(names):
+            return 'variable references differ'
+
+        mapping = dict(zip(entry.names, names))
+        for name in entry.codeNames:
+            if mapping.get(name, name) not in words:
+                return f'{name} is not mentioned'
+        return ''
@@ -0,0 +1,228 @@
+from gpt_prompt import prompt
+from concurrent.futures import ThreadPoolExecutor
+import ast
+import builtins
+import json
+import time
+import typing
+
+
+class TranslationProvider:
+    """
+    Translates instruct stmts into Python code that runs inside InstructNode.
+    Override Translate(). model names the translator, stored translations are keyed by it.
+    """
+    model = ''
+
+    def Translate(self, items: list, functions: list) -> list:
+        """
+        items: list of {id, stmt}. functions: list of {name, params} the code may call.
+        Return a list of {id, exec}. Items may be missing or malformed, the engine checks them.
+        """
+        raise NotImplementedError
+
+
+class OpenAIProvider(TranslationProvider):
+    """Translate through the OpenAI chat completion API with the prompt in gpt_prompt.py"""
+    def __init__(self, model= 'gpt-4', client= None):
+        self.model = model
+        self._client = client
+
+    def _Client(self):
+        if self._client is None:
+            # Optional dependency, only needed when stmts miss every local source
+            from openai import OpenAI
+            self._client = OpenAI()
+        return self._client
+
+    def Translate(self, items: list, functions: list) -> list:
+        res = self._Client().chat.completions.create(
+            model= self.model,
+            messages= [
+                { 'role': 'system',
+                'content': prompt + json.dumps(functions)
+                },
+                {
+                    'role': 'user',
+                    'content': json.dumps(items)
+                }
+            ]
+        )
+
+        return json.loads(res.choices[0].message.content)
+
+
+class FakeProvider(TranslationProvider):
+    """
+    Offline provider for tests. Looks stmts up in table (stmt -> exec),
+    or asks translate(stmt) when given. Unknown stmts are left out of the reply.
+    """
+    model = 'fake'
+
+    def __init__(self, table: dict = None, translate: typing.Callable = None, latency= 0.0):
+        self.table = dict() if table is None else table
+        self.translate = translate
+        self.latency = latency
+        self.calls = 0
+
+    def Translate(self, items: list, functions: list) -> list:
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        out = []
+        for item in items:
+            if self.translate is not None:
+                code = self.translate(item['stmt'])
+            else:
+                code = self.table.get(item['stmt'])
+
+            if code is not None:
+                out.append({'id': item['id'], 'exec': code})
+        return out
+
+
+class TranslationEngine:
+    """
+    Splits pending stmts into size-bounded batches, sends them to the provider concurrently
+    and merges the replies by id. A failed or incomplete batch is retried with exponential backoff,
+    only for the ids still missing.
+    """
+    def __init__(self, provider: TranslationProvider, maxBatchItems= 8, maxBatchChars= 2000, maxWorkers= 4, retries= 3, backoff= 0.5):
+        self.provider = provider
+        self.maxBatchItems = maxBatchItems
+        self.maxBatchChars = maxBatchChars
+        self.maxWorkers = maxWorkers
+        self.retries = retries
+        self.backoff = backoff
+
+    def Translate(self, stmts: dict, functions: list) -> dict:
+        """stmts: id -> stmt. Return id -> exec for every stmt that could be translated"""
+        batches = self._Split(stmts)
+        if len(batches) == 0:
+            return dict()
+
+        out = dict()
+        with ThreadPoolExecutor(max_workers= min(self.maxWorkers, len(batches))) as pool:
+            for result in pool.map(lambda batch: self._RunBatch(batch, functions), batches):
+                out.update(result)
+
+        missing = [i for i in stmts.keys() if i not in out]
+        if len(missing) > 0:
+            print(f'TranslationEngine:: no translation for ids {missing}')
+        return out
+
+    def _Split(self, stmts: dict) -> list:
+        batches = []
+        batch = []
+        size = 0
+        for i, stmt in stmts.items():
+            if len(batch) > 0 and (len(batch) >= self.maxBatchItems or size + len(stmt) > self.maxBatchChars):
+                batches.append(batch)
+                batch = []
+                size = 0
+            batch.append({'id': i, 'stmt': stmt})
+            size += len(stmt)
+
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def _RunBatch(self, batch: list, functions: list) -> dict:
+        out = dict()
+        pending = batch
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+            try:
+                reply = self.provider.Translate(pending, functions)
+                out.update(self._Accept(pending, reply))
+            except Exception as e:
+                print(f'TranslationEngine:: batch of {len(pending)} failed (attempt {attempt + 1}): ')
+                print(e)
+
+            pending = [item for item in pending if item['id'] not in out]
+            if len(pending) == 0:
+                break
+        return out
+
+    def _Accept(self, batch: list, reply) -> dict:
+        """Keep well-formed items of reply whose id belongs to batch"""
+        ids = set(item['id'] for item in batch)
+        out = dict()
+        if not isinstance(reply, list):
+            raise Exception(f'Expected a json array, got {type(reply).__name__}')
+
+        for obj in reply:
+            if not isinstance(obj, dict) or not isinstance(obj.get('exec'), str):
+                print(f'TranslationEngine:: dropping malformed item {obj}')
+                continue
+
+            i = obj.get('id')
+            if isinstance(i, str) and i.isdigit():
+                i = int(i)
+            if i not in ids:
+                print(f'TranslationEngine:: dropping item with unknown id {obj}')
+                continue
+            out[i] = obj['exec']
+        return out
+
+
+# What a translation may touch: the InstructNode accessors, self.value and a few pure builtins
+ALLOWED_METHODS = frozenset(['Decl', 'Assign', 'ValueOf', 'Call'])
+ALLOWED_BUILTINS = frozenset(['abs', 'min', 'max', 'round', 'len', 'int', 'float', 'str', 'bool', 'sum', 'range', 'list'])
+
+_AllowedNodes = (
+    ast.Module, ast.Expr, ast.Assign, ast.Call, ast.keyword, ast.Attribute, ast.Name, ast.Constant,
+    ast.List, ast.Tuple, ast.Subscript, ast.Slice, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+    ast.IfExp, ast.JoinedStr, ast.FormattedValue, ast.Load, ast.Store,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)
+
+
+def _CheckNode(node: ast.AST, parent: ast.AST):
+    if not isinstance(node, _AllowedNodes):
+        raise Exception(f'{type(node).__name__} is not allowed')
+
+    if isinstance(node, ast.Assign):
+        for target in node.targets:
+            if not (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name)
+                    and target.value.id == 'self' and target.attr == 'value'):
+                raise Exception('Only self.value can be assigned')
+
+    elif isinstance(node, ast.Attribute):
+        if not (isinstance(node.value, ast.Name) and node.value.id == 'self'):
+            raise Exception(f'Attribute {node.attr} is not on self')
+        if node.attr == 'value':
+            return
+        if node.attr not in ALLOWED_METHODS or not (isinstance(parent, ast.Call) and parent.func is node):
+            raise Exception(f'self.{node.attr} is not allowed')
+
+    elif isinstance(node, ast.Name):
+        if node.id == 'self':
+            if not isinstance(parent, ast.Attribute):
+                raise Exception('self can only be used to access its members')
+        elif node.id not in ALLOWED_BUILTINS or not (isinstance(parent, ast.Call) and parent.func is node):
+            raise Exception(f'Name {node.id} is not allowed')
+
+
+def CompileTranslation(code: str, name: str = '<instruct>'):
+    """
+    Validate a translation against the allowed names and compile it into a code object.
+    Raise if it does anything besides the InstructNode accessors and pure builtins.
+    """
+    tree = ast.parse(code, name, 'exec')
+    stack = [(tree, None)]
+    while len(stack) > 0:
+        node, parent = stack.pop()
+        _CheckNode(node, parent)
+        for child in ast.iter_child_nodes(node):
+            stack.append((child, node))
+
+    return compile(tree, name, 'exec')
+
+
+def TranslationGlobals() -> dict:
+    """Globals the compiled translations run with"""
+    return {'__builtins__': { name: getattr(builtins, name) for name in ALLOWED_BUILTINS }}
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+STORE_ENV = 'HOIL_TRANSLATION_STORE'
+DEFAULT_STORE = os.path.join(os.path.expanduser('~'), '.hoil', 'translations.db')
+
+# stmt -> code cache the server used before the store, imported into a new default store
+LEGACY_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cache.json')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS translations (
+    stmt_hash   TEXT NOT NULL,
+    funcs_hash  TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    stmt        TEXT NOT NULL,
+    code        TEXT NOT NULL,
+    last_used   REAL NOT NULL,
+    PRIMARY KEY (stmt_hash, funcs_hash, model)
+);
+CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used);
+'''
+
+
+def NormalizeStmt(stmt: str) -> str:
+    """Collapse whitespace so reformatted stmts share an entry"""
+    return ' '.join(stmt.split())
+
+
+def StmtHash(stmt: str) -> str:
+    return hashlib.sha1(NormalizeStmt(stmt).encode()).hexdigest()
+
+
+def FunctionsHash(functions: list) -> str:
+    """Hash of the function signatures sent in the prompt, independent of their order"""
+    sigs = sorted(json.dumps(f, sort_keys= True) for f in functions)
+    return hashlib.sha1('\n'.join(sigs).encode()).hexdigest()
+
+
+class TranslationStore:
+    """
+    Persistent instruct translation cache in SQLite, shared by every server process.
+    Entries are keyed by the normalized stmt, the function signatures and the model,
+    since a translation is only valid for the prompt it was made with.
+    Holds at most maxEntries, evicting the least recently used.
+    """
+    def __init__(self, path: str = None, maxEntries= 10000):
+        if path is None:
+            path = os.environ.get(STORE_ENV, DEFAULT_STORE)
+        self.path = path
+        self.maxEntries = maxEntries
+
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok= True)
+        db = self._Connect()
+        try:
+            with db:
+                db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    def _Connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation, so the store can be used from any thread
+        db = sqlite3.connect(self.path, timeout= 30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def GetMany(self, stmts: list, functions: list, model: str) -> dict:
+        """Return stmt -> code for the stmts in the store, and mark them used"""
+        funcsHash = FunctionsHash(functions)
+        hashes = dict()
+        for stmt in stmts:
+            hashes.setdefault(StmtHash(stmt), []).append(stmt)
+
+        out = dict()
+        if len(hashes) == 0:
+            return out
+
+        db = self._Connect()
+        try:
+            with db:
+                keys = list(hashes.keys())
+                # Stay below the sqlite host parameter limit
+                for begin in range(0, len(keys), 500):
+                    chunk = keys[begin : begin + 500]
+                    marks = ','.join('?' * len(chunk))
+                    rows = db.execute(
+                        f'SELECT stmt_hash, code FROM translations WHERE funcs_hash = ? AND model = ? AND stmt_hash IN ({marks})',
+                        [funcsHash, model] + chunk).fetchall()
+
+                    for stmtHash, code in rows:
+                        for stmt in hashes[stmtHash]:
+                            out[stmt] = code
+
+                    db.execute(
+                        f'UPDATE translations SET last_used = ? WHERE funcs_hash = ? AND model = ? AND stmt_hash IN ({marks})',
+                        [time.time(), funcsHash, model] + chunk)
+        finally:
+            db.close()
+        return out
+
+    def PutMany(self, codes: dict, functions: list, model: str):
+        """Store stmt -> code, then evict down to maxEntries"""
+        if len(codes) == 0:
+            return
+
+        funcsHash = FunctionsHash(functions)
+        now = time.time()
+        rows = [(StmtHash(stmt), funcsHash, model, NormalizeStmt(stmt), code, now) for stmt, code in codes.items()]
+
+        db = self._Connect()
+        try:
+            with db:
+                db.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)', rows)
+                db.execute(
+                    'DELETE FROM translations WHERE rowid IN '
+                    '(SELECT rowid FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.maxEntries,))
+        finally:
+            db.close()
+
+    def Entries(self, functions: list, model: str, limit= None) -> list:
+        """(stmt, code) made with the given functions and model, most recently used first"""
+        db = self._Connect()
+        try:
+            return db.execute(
+                'SELECT stmt, code FROM translations WHERE funcs_hash = ? AND model = ? ORDER BY last_used DESC LIMIT ?',
+                (FunctionsHash(functions), model, -1 if limit is None else limit)).fetchall()
+        finally:
+            db.close()
+
+    def ImportJson(self, path: str, functions: list, model: str) -> int:
+        """Migrate an old cache.json (stmt -> code) into the store. Return the number of entries"""
+        with open(path, 'r') as f:
+            cache = json.load(f)
+        self.PutMany(cache, functions, model)
+        return len(cache)
+
+    def __len__(self) -> int:
+        db = self._Connect()
+        try:
+            return db.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+        finally:
+            db.close()
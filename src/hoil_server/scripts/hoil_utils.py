@@ -1,9 +1,14 @@
-from collections import deque
-from robot import RobotArm 
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+import os
+import threading
+from arm_backend import ArmBackend
 import typing
-from openai import OpenAI
-import json
-from gpt_prompt import prompt
+from hoil_translation import TranslationProvider, TranslationEngine, OpenAIProvider, CompileTranslation, TranslationGlobals
+from hoil_translation_store import TranslationStore, LEGACY_JSON
+from hoil_stmt_similarity import StmtIndex
+from hoil_local_translator import LocalTranslator
+from hoil_motion import MotionQueue
 from copy import deepcopy
 
 
@@ -85,6 +90,9 @@ class HoilExprLexeme:
         self.isFunc = isFunc
         self.isArr = isArr
 
+        # Variable slot of var and array lexemes, resolved by CompileExpr()
+        self.slot = None
+
 
 class HoilExprLexer:
     def __init__(self, expr:str):
@@ -234,62 +242,278 @@ class HoilExprLexer:
 
         # [ is unary - in HOIL
         return HoilExprLexeme(spelling, isOp= True, isUnary= spelling == '[')
-    
 
-class VariableTable:
 
+class CompiledExpr:
+    """
+    Pre-tokenised HOIL expression. Literals are already converted and
+    the arguments of nested function calls and array indices are compiled as well,
+    so evaluation never looks at the source string again.
+    """
+    def __init__(self, spelling: str, lexemes: list):
+        self.spelling = spelling
+        self.lexemes = lexemes
+
+        # Python function built by CompileClosure(), created on first use by the closure backend
+        self.closure = None
+
+    def __str__(self):
+        return self.spelling
+
+    def __getstate__(self):
+        # Python functions cannot be pickled. Rebuilt on first use.
+        state = self.__dict__.copy()
+        state['closure'] = None
+        return state
+
+
+def CompileExpr(expr, symbols) -> CompiledExpr:
+    """Tokenise expr once and resolve its variables against symbols (SymbolTable).
+    Pass the result to EvaluateExpr() as many times as needed."""
+    if isinstance(expr, CompiledExpr):
+        return expr
+
+    lexer = HoilExprLexer(expr)
+    lexemes = []
+    while True:
+        lex = lexer.GetNextLexeme()
+
+        if lex is None:
+            break
+
+        if lex.isFunc:
+            lex.value = [CompileExpr(arg, symbols) for arg in lex.value]
+        elif lex.isArr:
+            lex.value = CompileExpr(lex.value, symbols)
+            lex.slot = symbols.Resolve(lex.spelling)
+        elif lex.isVar:
+            lex.slot = symbols.Resolve(lex.spelling)
+
+        lexemes.append(lex)
+
+    return CompiledExpr(expr, lexemes)
+
+
+# Python spelling of HOIL binary operators for the closure backend.
+# && and || go through _Ops, since Python's and/or would skip the right operand
+# while the interpreter always evaluates both.
+_ClosureBinOps = {
+    '+': '+',
+    '-': '-',
+    '*': '*',
+    '/': '/',
+    '%': '%',
+    '==': '==',
+    '!=': '!=',
+    '>': '>',
+    '>=': '>=',
+    '<': '<',
+    '<=': '<=',
+}
+
+def _ClosureVar(container, slot: int, spelling: str):
+    var = container.varTable.GetSlot(slot)
+    if var is None:
+        raise Exception(f"Use of variable before assignment! ${spelling}")
+    return var.Get()
+
+
+def _ClosureCall(container, spelling: str, args: list):
+    return container.functionMap[spelling].Evaluate(args)
+
+
+class _ClosureBuilder:
+    """Translate the lexemes of a CompiledExpr into the source of one Python expression"""
+    def __init__(self):
+        self.consts = {}
+
+    def Const(self, value) -> str:
+        name = f'_k{len(self.consts)}'
+        self.consts[name] = value
+        return name
+
+    def Build(self, expr: CompiledExpr) -> str:
+        stack = []
+        for lex in expr.lexemes:
+            if lex.isLiteral:
+                if type(lex.value) is float and lex.value == lex.value and abs(lex.value) != float('inf'):
+                    stack.append(repr(lex.value))
+                else:
+                    stack.append(self.Const(lex.value))
+            elif lex.isVar:
+                stack.append(f'_ClosureVar(container, {lex.slot}, {lex.spelling!r})')
+            elif lex.isOp:
+                src2 = stack.pop()
+
+                if lex.isUnary:
+                    if lex.spelling == '[':
+                        stack.append(f'(-{src2})')
+                    else:
+                        stack.append(f'_Ops[{lex.spelling!r}](None, {src2})')
+                    continue
+
+                src1 = stack.pop()
+                if lex.spelling in _ClosureBinOps:
+                    stack.append(f'({src1} {_ClosureBinOps[lex.spelling]} {src2})')
+                else:
+                    stack.append(f'_Ops[{lex.spelling!r}]({src1}, {src2})')
+            elif lex.isFunc:
+                args = self.Const(lex.value)
+                stack.append(f'_ClosureCall(container, {lex.spelling!r}, {args})')
+            elif lex.isArr:
+                index = self.Build(lex.value)
+                stack.append(f'_ClosureVar(container, {lex.slot}, {lex.spelling!r})[{index}]')
+
+        if len(stack) != 1:
+            raise ValueError(f'Malformed expression {expr.spelling}')
+
+        return stack[0]
+
+
+def CompileClosure(expr: CompiledExpr) -> typing.Callable:
+    """
+    Closure backend. Turn expr into a native Python function accepting the container.
+    Falls back to the interpreter if expr cannot be translated.
+    """
+    builder = _ClosureBuilder()
+    try:
+        src = f'def _closure(container):\n    return {builder.Build(expr)}\n'
+        scope = {
+            '_Ops': Ops,
+            '_ClosureVar': _ClosureVar,
+            '_ClosureCall': _ClosureCall,
+        }
+        scope.update(builder.consts)
+        exec(compile(src, f'<hoil {expr.spelling}>', 'exec'), scope)
+        return scope['_closure']
+    except (ValueError, IndexError, SyntaxError, RecursionError, MemoryError):
+        return lambda container: _InterpretExpr(expr, container)
+    
+
+class SymbolTable:
+    """
+    Interns variable spellings into dense slot indices.
+    Expressions and nodes resolve their slots once at build time.
+    """
     def __init__(self):
+        self._slots = {}
+        self._names = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def Resolve(self, var:str) -> int:
+        """Get the slot of var, allocating one if it is seen for the first time"""
+        slot = self._slots.get(var)
+        if slot is None:
+            slot = len(self._names)
+            self._slots[var] = slot
+            self._names.append(var)
+        return slot
+
+    def Find(self, var:str) -> typing.Optional[int]:
+        """Get the slot of var without allocating"""
+        return self._slots.get(var)
+
+    def Names(self) -> list:
+        """Spellings ordered by slot"""
+        return list(self._names)
+
+
+class VariableTable:
+    """
+    Scope stack with shallow binding: _cells holds the innermost binding of every slot,
+    so reads are a single list index regardless of scope depth.
+    Each scope remembers the bindings it shadows and restores them on Pop().
+    """
+
+    def __init__(self, symbols: SymbolTable = None):
+        self.symbols = SymbolTable() if symbols is None else symbols
         self._stack = deque()
+        self._cells = []
         self.Push()
 
     def Push(self):
         self._stack.append(_VarScope())
     
     def Pop(self):
-        self._stack.pop()
+        scope = self._stack.pop()
+        cells = self._cells
+        for slot, val in scope._shadowed:
+            cells[slot] = val
     
+    def Depth(self) -> int:
+        return len(self._stack)
+
     def Isolate(self):
         """
         Create a new isolated scope containing all previous scopes.
         Use it to create a function
         """
-        table = VariableTable()
+        table = VariableTable(self.symbols)
         for item in self._stack:
             table._stack.append(item)
+            for slot, val in item._table.items():
+                table._SetCell(slot, val)
         
         return table
 
     def Insert(self, var:str, val):
-        self._stack[len(self._stack) - 1].Insert(var, val)
+        self.InsertSlot(self.symbols.Resolve(var), val)
+
+    def InsertSlot(self, slot:int, val):
+        scope = self._stack[len(self._stack) - 1]
+        if scope.Get(slot) is None:
+            scope._shadowed.append((slot, self.GetSlot(slot)))
+        scope.Insert(slot, val)
+        self._SetCell(slot, val)
 
     def Get(self, var:str, topLevelOnly= False):
+        # Names unknown to the symbol table (e.g. from instruct stmts) cannot be bound
+        slot = self.symbols.Find(var)
+        if slot is None:
+            return None
+        return self.GetSlot(slot, topLevelOnly)
+
+    def GetSlot(self, slot:int, topLevelOnly= False):
         if topLevelOnly:
-            return self._stack[len(self._stack) - 1].Get(var)
-            
-        for scope in reversed(self._stack):
-            v = scope.Get(var)
-            if v is None:
-                continue
-            return v
-        
+            return self._stack[len(self._stack) - 1].Get(slot)
+
+        if slot < len(self._cells):
+            return self._cells[slot]
         return None
     
+    def Scopes(self, begin: int, end: int) -> list:
+        """Slot -> binding tables of the scopes at depth [begin, end)"""
+        return [self._stack[i]._table for i in range(begin, end)]
+
+    def Bindings(self) -> list:
+        """(slot, binding) pairs of the top scope, in insertion order"""
+        return list(self._stack[len(self._stack) - 1]._table.items())
+    
     def GetTempName(self) -> str:
         return self._stack[len(self.stack) - 1].GetTempName()
 
+    def _SetCell(self, slot:int, val):
+        cells = self._cells
+        if slot >= len(cells):
+            cells.extend([None] * (slot + 1 - len(cells)))
+        cells[slot] = val
+
 
 class _VarScope:
     def __init__(self):
         self._table = {}
         self._tempCtr = 0
 
-    def Insert(self, var:str, val):
-        self._table[var] = val
+        # (slot, binding) pairs overwritten by this scope
+        self._shadowed = []
 
-    def Get(self, var:str):
-        if var not in self._table.keys():
-            return None
-        return self._table[var]
+    def Insert(self, slot:int, val):
+        self._table[slot] = val
+
+    def Get(self, slot:int):
+        return self._table.get(slot)
     
     def GetTempName(self) -> str:
         s = f'%_temp{self._tempCtr}_%'
@@ -298,10 +522,39 @@ class _VarScope:
     
 
 class InstructTable:
-    def __init__(self):
+    def __init__(self, provider: TranslationProvider = None, engine: TranslationEngine = None, store: TranslationStore = None, verbose= False,
+                 fuzzyThreshold= None, lazy= False, prefetch= 4, local= True, lower= True):
         self._func = []
         self._in_stmt = []
         self._out_stmt = []
+        self._code = []
+        self.globals = TranslationGlobals()
+        self.verbose = verbose
+
+        # Run translations as native nodes where possible instead of exec()
+        self.lower = lower
+
+        # Similarity a stored stmt needs to stand in for another one, e.g. 0.9. None (default) to only reuse exact matches
+        self.fuzzyThreshold = fuzzyThreshold
+        self.nearHits = []
+
+        # Rule-based translator for common stmt shapes, tried before anything else
+        self.local = LocalTranslator() if local else None
+
+        if engine is None:
+            engine = TranslationEngine(OpenAIProvider() if provider is None else provider)
+        self.engine = engine
+        # Opened on first use, so that programs translated locally never create the default store
+        self.store = store
+
+        # Lazy mode translates a stmt the first time it runs, and prefetches the next ones in the background
+        self.lazy = lazy
+        self.prefetch = prefetch
+        self._futures = dict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._functions = None
+        self._model = None
 
     def InsertFunction(self, function):
         self._func.append(function)
@@ -316,6 +569,26 @@ class InstructTable:
         """Get the execution code
         """
         return self._out_stmt[index]
+
+    def GetCode(self, index: int):
+        """Get the compiled execution code. Raise if the stmt has no valid translation.
+        In lazy mode, waits for the translation and requests it (and prefetches the following stmts) if needed."""
+        code = self._code[index] if index < len(self._code) else None
+        if code is None and self.lazy and index < len(self._code):
+            self._Request([index])
+            self._Request(range(index + 1, min(index + 1 + self.prefetch, len(self._in_stmt))))
+            self._futures[index].result()
+            code = self._code[index]
+        if code is None:
+            raise Exception(f'InstructTable:: no valid translation for {self._in_stmt[index]}')
+        return code
+
+    def Statements(self) -> list:
+        """Raw instruct stmts, ordered by id"""
+        return list(self._in_stmt)
+
+    def Functions(self) -> list:
+        return list(self._func)
     
     def Evaluate(self):
         """
@@ -323,89 +596,222 @@ class InstructTable:
         """
         # Reserve space
         self._out_stmt = [None] * len(self._in_stmt)
-        cache = dict()
+        self._code = [None] * len(self._in_stmt)
+        self._futures = dict()
+        functions = self._FunctionDesc()
+        model = self.engine.provider.model
+
+        # id -> stmt of the stmts still to be translated
+        pending = dict()
+        names = [str(function) for function in self._func]
+        for i in range(len(self._in_stmt)):
+            code = None if self.local is None else self.local.Translate(self._in_stmt[i], names)
+            if code is not None:
+                self._out_stmt[i] = code
+            else:
+                pending[i] = self._in_stmt[i]
 
-        # Look at cache and find matching pair
+        # Look up the stored translations made with the same functions and model
         try:
-            with open('cache.json', 'r') as f:
-                cache: dict
-                cache = json.load(f)
-                
-                removeList = []
-                for i in range(len(self._in_stmt)):
-                    if self._in_stmt[i] in cache.keys():
-                        self._out_stmt[i] = cache[self._in_stmt[i]]
-                        removeList.append(self._in_stmt[i])
-                
-                # Remove all matched in stmts
-                for stmt in removeList:
-                    print(f'InstructTable:: remove: {stmt}')
-                    self._in_stmt.remove(stmt)
+            cache = dict()
+            if len(pending) > 0:
+                cache = self._Store(functions, model).GetMany(list(pending.values()), functions, model)
         except Exception as e:
-            print('InstructTable:: Error occurred while reading in cache: ')
+            print('InstructTable:: Error occurred while reading the translation store: ')
             print(e)
+            cache = dict()
+
+        for i in list(pending.keys()):
+            if pending[i] in cache:
+                self._out_stmt[i] = cache[pending[i]]
+                del pending[i]
 
+        if len(pending) > 0 and self.fuzzyThreshold is not None:
+            self._FuzzyLookup(pending, functions, model)
 
-        if len(self._in_stmt) == 0:
+        if len(pending) == 0:
             print('InstructTable:: all hit the cache!')
+            self._Compile(range(len(self._out_stmt)))
             return
 
-        # Construct function description
-        func_desc = [ {'name': str(function), 'params':  ', '.join(map(str, function.paramNodes)) } for function in self._func ]
-        func_desc_json = json.dumps(func_desc)
-        #print(prompt + func_desc_json)
-
-
-        # Convert the remaining list into json and feed it to gpt
-        dic =  [ {'id': i, 'stmt': self._in_stmt[i]} for i in range(len(self._in_stmt)) ]
-        json_dic = json.dumps(dic)
-
-        client = OpenAI()
-        res = client.chat.completions.create(
-            model= 'gpt-4',
-            messages= [
-                { 'role': 'system',
-                'content': prompt + func_desc_json
-                },
-                {
-                    'role': 'user',
-                    'content': json_dic
-                }
-            ]
-        )
-
-        res_dic = json.loads(res.choices[0].message.content)
-        
-        # Append the chatgpt-generated responses to the cache
-        for obj in res_dic:
-            self._out_stmt[obj['id']] = obj['exec']
-            cache[self._in_stmt[obj['id']]] = obj['exec']
-        
-        with open('cache.json', 'w') as f:
-            json.dump(cache, f)
+        if self.lazy:
+            # Compile what is known and start on the first stmts the program will reach
+            self._Compile([i for i in range(len(self._out_stmt)) if i not in pending])
+            self._functions = functions
+            self._model = model
+            self._pool = ThreadPoolExecutor(max_workers= 2)
+            self._Request(list(pending.keys())[: self.prefetch])
+            return
+
+        # Translate the remaining stmts in concurrent batches
+        self._Translate(pending, functions, model)
+        self._Compile(range(len(self._out_stmt)))
+
+    def Close(self):
+        """Drop the outstanding prefetches of lazy mode"""
+        if self._pool is not None:
+            self._pool.shutdown(wait= False, cancel_futures= True)
+            self._pool = None
+
+    def _Request(self, ids):
+        """Lazy mode. Start translating the stmts of ids that are neither translated nor requested, as one batch"""
+        with self._lock:
+            pending = { i: self._in_stmt[i] for i in ids if self._code[i] is None and i not in self._futures }
+            if len(pending) == 0:
+                return
+
+            future = Future()
+            if self._pool is None:
+                future.set_result(None)
+            else:
+                future = self._pool.submit(self._TranslateLazy, pending)
+            for i in pending:
+                self._futures[i] = future
+
+    def _TranslateLazy(self, pending: dict):
+        self._Translate(pending, self._functions, self._model)
+        self._Compile(pending.keys())
+
+    def _Translate(self, pending: dict, functions: list, model: str):
+        """Translate pending (id -> stmt) with the engine and save the results in the store"""
+        res = self.engine.Translate(pending, functions)
+        for i, code in res.items():
+            self._out_stmt[i] = code
+
+        try:
+            self._Store(functions, model).PutMany({ self._in_stmt[i]: code for i, code in res.items() }, functions, model)
+        except Exception as e:
+            print('InstructTable:: Error occurred while writing the translation store: ')
+            print(e)
+
+    def _Store(self, functions: list, model: str) -> TranslationStore:
+        """The translation store, opening the default one on first use. A new default store imports the legacy cache.json"""
+        if self.store is None:
+            store = TranslationStore()
+            if len(store) == 0 and os.path.exists(LEGACY_JSON):
+                count = store.ImportJson(LEGACY_JSON, functions, model)
+                print(f'InstructTable:: imported {count} translations from {LEGACY_JSON}')
+            self.store = store
+        return self.store
+
+    def _FuzzyLookup(self, pending: dict, functions: list, model: str):
+        """Fill pending stmts from similar stored ones and remove them from pending"""
+        index = StmtIndex(threshold= self.fuzzyThreshold)
+        try:
+            for stmt, code in self._Store(functions, model).Entries(functions, model):
+                index.Add(stmt, code)
+        except Exception as e:
+            print('InstructTable:: Error occurred while reading the translation store: ')
+            print(e)
+
+        for i in list(pending.keys()):
+            code = index.Lookup(pending[i])
+            if code is not None:
+                self._out_stmt[i] = code
+                del pending[i]
+
+        self.nearHits = index.nearHits
+        for hit in self.nearHits:
+            print(f'InstructTable:: near hit {hit}')
+
+    def _Compile(self, ids):
+        """Compile the translations of ids once. Invalid ones are left out and raise when run"""
+        for i in ids:
+            if self._out_stmt[i] is None:
+                continue
+            try:
+                self._code[i] = CompileTranslation(self._out_stmt[i], f'<instruct {i}>')
+            except Exception as e:
+                print(f'InstructTable:: rejected translation of {self._in_stmt[i]}: {self._out_stmt[i]}')
+                print(e)
+
+    def _FunctionDesc(self) -> list:
+        """Functions the translations may call, as described to the provider"""
+        return [ {'name': str(function), 'params':  ', '.join(map(str, function.paramNodes)) } for function in self._func ]
 
 
     def Warn(self):
         print('InstructTable:: Warn() is called. Check the instruct stmt to make sure it is logical.')
 
 
+class FunctionMemo:
+    """Bounded LRU cache of the values a pure function returned, keyed by its argument values"""
+    def __init__(self, maxSize= 1024):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._table = OrderedDict()
+
+    def Key(self, args: list) -> typing.Optional[tuple]:
+        """Make a key out of argument values. None if an argument is unhashable (e.g. arrays)"""
+        # Keep the type so that 1.0, 1 and True do not share an entry
+        key = tuple((arg.__class__, arg) for arg in args)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def Get(self, key: tuple) -> typing.Optional[list]:
+        """Values the call pushed to returnVal, or None on a miss"""
+        values = self._table.get(key)
+        if values is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._table.move_to_end(key)
+        return values
+
+    def Put(self, key: tuple, values: list):
+        self._table[key] = values
+        self._table.move_to_end(key)
+        if len(self._table) > self.maxSize:
+            self._table.popitem(last= False)
+
+    def Stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._table)}
+
+
 class ExecVarContainer:
-    def __init__(self, robot: RobotArm = None, instructTable: InstructTable = None, functionMap: dict = None, noROS= False):
-        self.varTable = VariableTable() 
+    def __init__(self, robot: ArmBackend = None, instructTable: InstructTable = None, functionMap: dict = None, noROS= False, exprBackend= 'interp', symbols: SymbolTable = None, memoize= True,
+                 motion: MotionQueue = None):
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.varTable = VariableTable(self.symbols)
         self.loopStack = deque()
         self.currentFunc = None
         self.noROS = noROS
         self.returnVal = []
+        # Set by $return until the function returns
+        self.returning = False
+
+        # 'interp' evaluates expressions with the stack machine,
+        # 'closure' compiles them into Python functions on first use
+        if exprBackend not in ('interp', 'closure'):
+            raise Exception(f'Unknown expression backend {exprBackend}')
+        self.exprBackend = exprBackend
+
+        # Memoize HOIL functions found to be pure
+        self.memoize = memoize
+
+        # Set while the program runs on the bytecode VM, so that calls from Python go through it
+        self.vm = None
         
         if functionMap is None:
             self.functionMap = dict()
         else:
             self.functionMap = functionMap
         if robot is None and not noROS:
+            # Needs ROS and MoveIt, only imported when the real arm is used
+            from robot import RobotArm
             self.robot = RobotArm()
         else:
             self.robot = robot
 
+        # Motion natives queue arm commands here instead of calling the robot directly
+        if motion is None and self.robot is not None:
+            motion = MotionQueue(self.robot)
+        self.motion = motion
 
         if instructTable is None:
             self.instructTable = InstructTable()
@@ -413,22 +819,39 @@ class ExecVarContainer:
             self.instructTable = instructTable
     
     def NewScope(self):
-        return ExecVarContainer(robot= self.robot, instructTable= self.instructTable, functionMap= self.functionMap, noROS= self.noROS)
+        return ExecVarContainer(robot= self.robot, instructTable= self.instructTable, functionMap= self.functionMap, noROS= self.noROS, exprBackend= self.exprBackend, symbols= self.symbols, memoize= self.memoize,
+                              motion= self.motion)
+
+    def SyncMotion(self):
+        """
+        Wait for the queued arm motions, if there is a motion queue.
+        Objects move with the arm once grabbed, so call before reading the position of scene objects.
+        """
+        if self.motion is not None:
+            self.motion.Sync()
 
 
 def EvaluateExpr(expr, container: ExecVarContainer) -> object:
-    stack = deque()
-    lexer = HoilExprLexer(expr)
-    while True:
-        lex = lexer.GetNextLexeme()
+    """Evaluate expr, either a CompiledExpr or a raw HOIL expression string"""
+    if not isinstance(expr, CompiledExpr):
+        expr = CompileExpr(expr, container.symbols)
 
-        if lex is None:
-            break
+    if container.exprBackend == 'closure':
+        if expr.closure is None:
+            expr.closure = CompileClosure(expr)
+        return expr.closure(container)
+
+    return _InterpretExpr(expr, container)
 
+
+def _InterpretExpr(expr: CompiledExpr, container: ExecVarContainer) -> object:
+    varTable = container.varTable
+    stack = []
+    for lex in expr.lexemes:
         if lex.isLiteral:
             stack.append(lex.value)
         elif lex.isVar:
-            var = container.varTable.Get(lex.spelling)
+            var = varTable.GetSlot(lex.slot)
             if var is None: 
                 # TODO: handle use-of-variable before assignment
                 raise Exception(f"Use of variable before assignment! ${lex.spelling}")
@@ -447,14 +870,11 @@ def EvaluateExpr(expr, container: ExecVarContainer) -> object:
             stack.append(val)
         elif lex.isFunc:
             f = container.functionMap[lex.spelling]
-            f.Call(lex.value)
-            stack.append(container.returnVal.pop())
+            stack.append(f.Evaluate(lex.value))
         elif lex.isArr:
-            arr = container.varTable.Get(lex.spelling).Get()
+            arr = varTable.GetSlot(lex.slot).Get()
             val = arr[EvaluateExpr(lex.value, container)]
             stack.append(val)
-            
-        
     
     val = stack.pop()
 
@@ -462,4 +882,4 @@ def EvaluateExpr(expr, container: ExecVarContainer) -> object:
         # TODO: Raise error on stack not empty after expr
         raise Exception
 
-    return val
\ No newline at end of file
+    return val
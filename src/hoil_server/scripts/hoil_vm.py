@@ -0,0 +1,486 @@
+from hoil_utils import ExecVarContainer, CompiledExpr, Ops
+from hoil_exec_nodes import *
+import operator
+import typing
+
+
+# Opcodes. Each instruction is a tuple (op, a, b)
+OP_LOAD = 0             # push value of slot a (spelling b)
+OP_CONST = 1            # push a
+OP_BINOP = 2            # pop v2, v1 and push a(v1, v2)
+OP_NEG = 3              # unary minus ([ in HOIL)
+OP_INDEX = 4            # pop index and push array in slot a (spelling b) at index
+OP_JUMP = 5             # jump to a
+OP_JUMP_IF_FALSE = 6    # pop value and jump to a if it is falsy
+OP_DECL = 7             # pop value and declare/assign it with DeclNode a
+OP_INSERT = 8           # pop value, index and insert into array in slot a
+OP_SCOPE_PUSH = 9
+OP_SCOPE_POP = 10
+OP_CALL_BEGIN = 11      # push a scope and start calling function a. Natives get no scope
+OP_PARAM = 12           # pop value into param a of the function being called
+OP_CALL_INVOKE = 13     # enter the function being called. A native is invoked right away, and its value
+                        # taken by the OP_PUSH_RET/OP_DROP_RET that follows
+OP_PUSH_RET = 14        # move the value returned by the last call onto the stack
+OP_DROP_RET = 15        # discard the value returned by the last call, if any
+OP_RETURN = 16          # pop value, return it
+OP_RETURN_VOID = 17
+OP_RUN_NODE = 18        # fall back to the tree walker for node a
+OP_INSTRUCT = 19        # run instruct node a and push its value
+OP_POP = 20
+OP_HALT = 21
+OP_TAIL_INVOKE = 22     # enter the function being called in place of the current one if it is safe,
+                        # a is the set of slots read by string templates in the args.
+                        # Otherwise same as OP_CALL_INVOKE
+OP_SKIP_FIXED = 23      # jump to b if DeclNode a would assign a fixed variable, skipping its value like the tree walker
+
+_BinOps = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+
+def _UnknownOp(spelling: str) -> typing.Callable:
+    # Defer the error until the op runs, as the interpreter does
+    return lambda v1, v2: Ops[spelling](v1, v2)
+
+
+class _LoopContext:
+    def __init__(self, scopeDepth: int, continueTarget: int):
+        self.scopeDepth = scopeDepth
+        self.continueTarget = continueTarget
+        self.breakJumps = []
+
+
+class HoilProgram:
+    """
+    Flat instruction array compiled from the ExecNode graph.
+    Function bodies are compiled on their first call and appended to the same array,
+    as functions are registered (and natives inserted) only after the graph is built.
+    """
+    def __init__(self, container: ExecVarContainer):
+        self.container = container
+        self.code = []
+        self.mainEntry = None
+        self._entries = {}
+        self._scopeDepth = 0
+        self._loops = []
+        self._inFunction = False
+
+        # Return address of calls made from Python
+        self._Emit(OP_HALT)
+
+    def CompileMain(self, node: ExecNode):
+        self.mainEntry = len(self.code)
+        self._CompileBlock(node)
+        self._Emit(OP_HALT)
+
+    def FunctionEntry(self, func: FunctionNode) -> int:
+        """Get the address of func's body, compiling it on first use"""
+        entry = self._entries.get(func)
+        if entry is not None:
+            return entry
+
+        entry = len(self.code)
+        self._entries[func] = entry
+
+        prevState = self._scopeDepth, self._loops, self._inFunction
+        self._scopeDepth, self._loops, self._inFunction = 0, [], True
+
+        self._CompileBlock(func.body)
+        self._Emit(OP_RETURN_VOID)
+
+        self._scopeDepth, self._loops, self._inFunction = prevState
+        return entry
+
+    def _Emit(self, op: int, a= None, b= None) -> int:
+        self.code.append((op, a, b))
+        return len(self.code) - 1
+
+    def _Patch(self, index: int, target: int):
+        op, _, b = self.code[index]
+        self.code[index] = (op, target, b)
+
+    def _CompileBlock(self, node: typing.Optional[ExecNode]):
+        while node is not None:
+            self._CompileNode(node)
+            node = node.next
+
+    def _CompileNode(self, node: ExecNode):
+        if isinstance(node, EmptyNode):
+            return
+
+        if isinstance(node, DeclNode):
+            if node.expr is None or node.directAssignment:
+                self._Emit(OP_RUN_NODE, node)
+            else:
+                skip = self._Emit(OP_SKIP_FIXED, node)
+                self._CompileExpr(node.expr)
+                self._Emit(OP_DECL, node)
+                self.code[skip] = (OP_SKIP_FIXED, node, len(self.code))
+
+        elif isinstance(node, InsertNode):
+            self._CompileExpr(node.index)
+            self._CompileExpr(node.expr)
+            self._Emit(OP_INSERT, node.slot, node.ident)
+
+        elif isinstance(node, ExprNode):
+            self._CompileExpr(node.expr)
+            self._Emit(OP_POP)
+
+        elif isinstance(node, ScopedNode):
+            self._Emit(OP_SCOPE_PUSH)
+            self._scopeDepth += 1
+            self._CompileBlock(node.node)
+            self._scopeDepth -= 1
+            self._Emit(OP_SCOPE_POP)
+
+        elif isinstance(node, BranchNode):
+            endJumps = []
+            for cond in [node.ifNode] + node.elifNodes:
+                if isinstance(cond, EmptyNode):
+                    continue
+                self._CompileCond(cond.condNode)
+                skip = self._Emit(OP_JUMP_IF_FALSE)
+                self._CompileBlock(cond.execNode)
+                endJumps.append(self._Emit(OP_JUMP))
+                self._Patch(skip, len(self.code))
+
+            self._CompileBlock(node.elseNode)
+            for jump in endJumps:
+                self._Patch(jump, len(self.code))
+
+        elif isinstance(node, LoopNode):
+            loop = _LoopContext(self._scopeDepth, len(self.code))
+            self._CompileCond(node.condNode)
+            exitJump = self._Emit(OP_JUMP_IF_FALSE)
+
+            self._loops.append(loop)
+            self._CompileBlock(node.bodyNode)
+            self._loops.pop()
+
+            self._Emit(OP_JUMP, loop.continueTarget)
+            self._Patch(exitJump, len(self.code))
+            for jump in loop.breakJumps:
+                self._Patch(jump, len(self.code))
+
+        elif isinstance(node, BreakNode) or isinstance(node, ContinueNode):
+            if len(self._loops) == 0:
+                raise Exception('HoilProgram:: $break or $continue outside of a loop')
+            loop = self._loops[len(self._loops) - 1]
+
+            for _ in range(self._scopeDepth - loop.scopeDepth):
+                self._Emit(OP_SCOPE_POP)
+
+            if isinstance(node, BreakNode):
+                loop.breakJumps.append(self._Emit(OP_JUMP))
+            else:
+                self._Emit(OP_JUMP, loop.continueTarget)
+
+        elif isinstance(node, ReturnNode):
+            if not self._inFunction:
+                # Nothing to return from, the program goes on as on the tree walker
+                if node.expr is not None:
+                    self._CompileExpr(node.expr)
+                    self._Emit(OP_POP)
+            elif node.expr is None:
+                self._Emit(OP_RETURN_VOID)
+            elif len(node.expr.lexemes) == 1 and node.expr.lexemes[0].isFunc:
+                # $return $,%f%,...$^ is a tail call
+                lex = node.expr.lexemes[0]
+                self._CompileCall(lex.spelling, lex.value, OP_TAIL_INVOKE,
+                                  frozenset(TemplateSlots(node.expr, self.container)))
+                self._Emit(OP_PUSH_RET)
+                self._Emit(OP_RETURN)
+            else:
+                self._CompileExpr(node.expr)
+                self._Emit(OP_RETURN)
+
+        elif isinstance(node, CallNode):
+            self._CompileCall(node.ident, node.args)
+            self._Emit(OP_DROP_RET)
+
+        else:
+            # FunctionNode registration, InstructNode, NativeNode etc.
+            self._Emit(OP_RUN_NODE, node)
+
+    def _CompileCond(self, node: ExecNode):
+        if isinstance(node, InstructNode):
+            self._Emit(OP_INSTRUCT, node)
+        else:
+            self._CompileExpr(node.expr)
+
+    def _CompileCall(self, ident: str, args: list, invoke= OP_CALL_INVOKE, invokeArg= None):
+        self._Emit(OP_CALL_BEGIN, ident)
+        for i in range(len(args)):
+            # Empty arg list of $,%f%,$^
+            if len(args[i].lexemes) == 0:
+                continue
+            self._CompileExpr(args[i])
+            self._Emit(OP_PARAM, i)
+        self._Emit(invoke, invokeArg)
+
+    def _CompileExpr(self, expr: CompiledExpr):
+        for lex in expr.lexemes:
+            if lex.isLiteral:
+                self._Emit(OP_CONST, lex.value)
+            elif lex.isVar:
+                self._Emit(OP_LOAD, lex.slot, lex.spelling)
+            elif lex.isOp:
+                if lex.isUnary and lex.spelling == '[':
+                    self._Emit(OP_NEG)
+                elif lex.isUnary:
+                    raise Exception(f'HoilProgram:: unknown unary op {lex.spelling}')
+                elif lex.spelling in _BinOps:
+                    self._Emit(OP_BINOP, _BinOps[lex.spelling])
+                else:
+                    # && and || evaluate both operands, like the interpreter
+                    self._Emit(OP_BINOP, Ops.get(lex.spelling, _UnknownOp(lex.spelling)))
+            elif lex.isFunc:
+                self._CompileCall(lex.spelling, lex.value)
+                self._Emit(OP_PUSH_RET)
+            elif lex.isArr:
+                self._CompileExpr(lex.value)
+                self._Emit(OP_INDEX, lex.slot, lex.spelling)
+
+
+class _Frame:
+    def __init__(self, returnPc: int, func: FunctionNode, prevFunc, scopeDepth: int, memoKey= None, retDepth= 0):
+        self.returnPc = returnPc
+        self.func = func
+        self.prevFunc = prevFunc
+        self.scopeDepth = scopeDepth
+
+        # Set when the return values are to be stored in func.memo
+        self.memoKey = memoKey
+        self.retDepth = retDepth
+
+
+class HoilVM:
+    """
+    Dispatch loop over a HoilProgram. Calls, loops and branches are jumps within
+    the instruction array and HOIL frames live in an explicit list, so recursion
+    does not grow the Python stack. Calls in tail position reuse the caller's frame.
+    Drop-in replacement for running the node list with the tree walker.
+    """
+    def __init__(self, container: ExecVarContainer, program: HoilProgram):
+        self.container = container
+        self.program = program
+
+    def Run(self):
+        self._Execute(self.program.mainEntry, [])
+
+    def Call(self, func: FunctionNode, args: list):
+        """Call func with already evaluated args from Python, e.g. from instruct stmts"""
+        container = self.container
+        prevFunc = container.currentFunc
+        container.currentFunc = func
+        container.varTable.Push()
+        for i in range(len(func.paramNodes)):
+            func.paramNodes[i].Declare(args[i])
+
+        frames = []
+        # Return to the OP_HALT at address 0
+        pc = self._Enter(func, prevFunc, 0, frames)
+        if pc is not None:
+            self._Execute(pc, frames)
+
+    def _Enter(self, func: FunctionNode, prevFunc, returnPc: int, frames: list) -> typing.Optional[int]:
+        """Push a frame for func, whose params are set on top of the stack.
+        Return the address to continue at, or None if the call was answered by the memo"""
+        container = self.container
+        varTable = container.varTable
+
+        memoKey = None
+        memo = func.Memo()
+        if memo is not None:
+            memoKey = func.MemoKey()
+            values = memo.Get(memoKey) if memoKey is not None else None
+            if values is not None:
+                container.returnVal.extend(values)
+                varTable.Pop()
+                container.currentFunc = prevFunc
+                return None
+
+        frames.append(_Frame(returnPc, func, prevFunc, varTable.Depth() - 1, memoKey, len(container.returnVal)))
+        return self.program.FunctionEntry(func)
+
+    def _Return(self, frames: list) -> int:
+        """Pop the current frame and get its return address"""
+        container = self.container
+        varTable = container.varTable
+
+        frame = frames.pop()
+        if frame.memoKey is not None:
+            frame.func.memo.Put(frame.memoKey, container.returnVal[frame.retDepth:])
+        while varTable.Depth() > frame.scopeDepth:
+            varTable.Pop()
+        container.currentFunc = frame.prevFunc
+        return frame.returnPc
+
+    def _TailCall(self, func: FunctionNode, argSlots: frozenset, frames: list) -> typing.Optional[int]:
+        """
+        Replace the current frame's scopes with the params of func, which are on top of the stack.
+        Only done when func cannot observe any variable bound in the current frame.
+        Return the address to continue at, or None if not possible.
+        """
+        if len(frames) == 0:
+            return None
+
+        free = func.FreeSlots()
+        if free is None:
+            return None
+
+        varTable = self.container.varTable
+        frame = frames[len(frames) - 1]
+        callerScopes = varTable.Scopes(frame.scopeDepth, varTable.Depth() - 1)
+        for scope in callerScopes:
+            if not free.isdisjoint(scope) or not argSlots.isdisjoint(scope):
+                return None
+
+        memo = func.Memo()
+        if memo is not None:
+            memoKey = func.MemoKey()
+            values = memo.Get(memoKey) if memoKey is not None else None
+            if values is not None:
+                # Answered by the memo. The caller returns the same values
+                self.container.returnVal.extend(values)
+                return self._Return(frames)
+
+        params = varTable.Bindings()
+        while varTable.Depth() > frame.scopeDepth:
+            varTable.Pop()
+        varTable.Push()
+        for slot, val in params:
+            varTable.InsertSlot(slot, val)
+
+        # The frame keeps its return address, memo key and the currentFunc to restore
+        self.container.currentFunc = func
+        return self.program.FunctionEntry(func)
+
+    def _Execute(self, pc: int, frames: list):
+        container = self.container
+        program = self.program
+        code = program.code
+        varTable = container.varTable
+        returnVal = container.returnVal
+
+        stack = []
+        # (function, previous currentFunc, arg values of a native) of calls whose args are being evaluated
+        pending = []
+
+        while True:
+            op, a, b = code[pc]
+            pc += 1
+
+            if op == OP_LOAD:
+                var = varTable.GetSlot(a)
+                if var is None:
+                    raise Exception(f"Use of variable before assignment! ${b}")
+                stack.append(var.Get())
+            elif op == OP_CONST:
+                stack.append(a)
+            elif op == OP_BINOP:
+                v2 = stack.pop()
+                stack.append(a(stack.pop(), v2))
+            elif op == OP_JUMP_IF_FALSE:
+                if not stack.pop():
+                    pc = a
+            elif op == OP_DECL:
+                a.Declare(stack.pop())
+            elif op == OP_SKIP_FIXED:
+                var = varTable.GetSlot(a.slot, topLevelOnly= a.paramDecl)
+                if var is not None and var.fixed:
+                    pc = b
+            elif op == OP_JUMP:
+                pc = a
+            elif op == OP_SCOPE_PUSH:
+                varTable.Push()
+            elif op == OP_SCOPE_POP:
+                varTable.Pop()
+            elif op == OP_INDEX:
+                index = stack.pop()
+                stack.append(varTable.GetSlot(a).Get()[index])
+            elif op == OP_NEG:
+                stack.append(-stack.pop())
+            elif op == OP_INSERT:
+                val = stack.pop()
+                index = stack.pop()
+                varTable.GetSlot(a).Get()[index] = val
+            elif op == OP_CALL_BEGIN:
+                func = container.functionMap[a]
+                if isinstance(func, NativeFunction):
+                    pending.append((func, None, []))
+                else:
+                    pending.append((func, container.currentFunc, None))
+                    container.currentFunc = func
+                    varTable.Push()
+            elif op == OP_PARAM:
+                func, _, values = pending[len(pending) - 1]
+                val = stack.pop()
+                if a < len(func.paramNodes):
+                    if values is not None:
+                        values.append(val)
+                    else:
+                        func.paramNodes[a].Declare(val)
+            elif op == OP_CALL_INVOKE or op == OP_TAIL_INVOKE:
+                func, prevFunc, values = pending.pop()
+
+                if values is not None:
+                    val = func.Invoke(values)
+                    # Every invoke is followed by OP_PUSH_RET or OP_DROP_RET
+                    if code[pc][0] == OP_PUSH_RET:
+                        stack.append(val)
+                    pc += 1
+                    continue
+
+                target = None
+                if op == OP_TAIL_INVOKE:
+                    target = self._TailCall(func, a, frames)
+                if target is None:
+                    target = self._Enter(func, prevFunc, pc, frames)
+                if target is not None:
+                    pc = target
+            elif op == OP_PUSH_RET:
+                stack.append(returnVal.pop())
+            elif op == OP_DROP_RET:
+                if len(returnVal) > 0:
+                    returnVal.pop()
+            elif op == OP_RETURN or op == OP_RETURN_VOID:
+                if op == OP_RETURN:
+                    returnVal.append(stack.pop())
+
+                if len(frames) == 0:
+                    return
+                pc = self._Return(frames)
+            elif op == OP_RUN_NODE:
+                a.Run()
+            elif op == OP_INSTRUCT:
+                a.Run()
+                stack.append(a.value)
+            elif op == OP_POP:
+                stack.pop()
+            elif op == OP_HALT:
+                return
+            else:
+                raise Exception(f'HoilVM:: unknown opcode {op}')
+
+
+def RunProgram(node: ExecNode, container: ExecVarContainer):
+    """Compile the node list built by BuildExecNode and execute it on the VM"""
+    program = HoilProgram(container)
+    program.CompileMain(node)
+
+    container.vm = HoilVM(container, program)
+    try:
+        container.vm.Run()
+    finally:
+        container.vm = None
@@ -9,20 +9,51 @@ from math import pi
 # For instantiating a demo scene
 from moveit_msgs.msg import CollisionObject
 from shape_msgs.msg import SolidPrimitive
+from sensor_msgs.msg import JointState
 
 import random
 
-class SceneObject:
-    def __init__(self, id: str, x= 0.0, y= 0.0, z= 0.0, height= 0.0):
-        self.id = id
-        self.x = x
-        self.y = y
-        self.z = z
-        self.height = height
+from arm_backend import ArmBackend, SceneObject, StateCache
+from hoil_plan_cache import Planner, CachedPlanner, PlanCache
 
 
-class RobotArm:
-    def __init__(self):
+def PoseTarget(pose: Pose) -> tuple:
+    return (pose.position.x, pose.position.y, pose.position.z,
+            pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w)
+
+
+class MoveItPlanner(Planner):
+    """Plans and executes pose targets of the arm move group"""
+    def __init__(self, arm):
+        self.arm = arm
+
+    def CurrentJoints(self) -> tuple:
+        return self.arm.CurrentJoints()
+
+    def SceneRevision(self) -> int:
+        return self.arm.sceneRevision
+
+    def Plan(self, target: tuple):
+        p = Pose()
+        p.position.x, p.position.y, p.position.z = target[0 : 3]
+        p.orientation.x, p.orientation.y, p.orientation.z, p.orientation.w = target[3 : 7]
+
+        self.arm.arm_group.set_pose_target(p)
+        res = self.arm.arm_group.plan()
+        self.arm.arm_group.clear_pose_targets()
+
+        # Noetic returns (success, trajectory, planning time, error code), older releases the trajectory only
+        if isinstance(res, tuple):
+            return res[1] if res[0] else None
+        return res if len(res.joint_trajectory.points) > 0 else None
+
+    def Execute(self, trajectory, wait= True):
+        return self.arm.arm_group.execute(trajectory, wait= wait)
+
+
+class RobotArm(ArmBackend):
+    """ArmBackend driving the Kinova arm through MoveIt"""
+    def __init__(self, planCache: PlanCache = None, stateMaxAge= 5.0):
         # Initialise components for Kinova arm
         self.hoilRosNode = rospy.init_node('hoil_execution_server', anonymous= False)
         self.scene = moveit_commander.PlanningSceneInterface()
@@ -30,6 +61,15 @@ class RobotArm:
         self.arm_group = moveit_commander.MoveGroupCommander('arm')
         self.gripper_group = moveit_commander.MoveGroupCommander('gripper')
         self.arm_pose = Pose()
+
+        # Pose and joints known locally, refreshed after every motion and checked against /joint_states
+        self.state = StateCache(maxAge= stateMaxAge)
+        self.arm_joints = self.arm_group.get_active_joints()
+        self.jointStateSub = rospy.Subscriber('joint_states', JointState, self._OnJointState, queue_size= 1)
+
+        # Bumped on every planning scene change, invalidating the cached plans
+        self.sceneRevision = 0
+        self.planner = CachedPlanner(MoveItPlanner(self), planCache)
         self.scene_objects = self.InitialiseDemo()
 
         self.eef_link = self.arm_group.get_end_effector_link()
@@ -74,6 +114,7 @@ class RobotArm:
         self.arm_group.set_pose_target(self.arm_pose)
         self.arm_group.go(wait= True)
         self.arm_group.clear_pose_targets()
+        self.state.Invalidate()
 
         self.OpenGripper()
 
@@ -87,37 +128,110 @@ class RobotArm:
     
     def MoveBy(self, x, y, z, wait= True):
         """Add x, y, z to current position"""
-        cur_pose = self.arm_group.get_current_pose()
+        cur_pose = self.CurrentPose()
         p = Pose()
-        p.position.x = cur_pose.pose.position.x + x
-        p.position.y = cur_pose.pose.position.y + y
-        p.position.z = cur_pose.pose.position.z + z
-        p.orientation.x = cur_pose.pose.orientation.x
-        p.orientation.y = cur_pose.pose.orientation.y
-        p.orientation.z = cur_pose.pose.orientation.z
-        p.orientation.w = cur_pose.pose.orientation.w
+        p.position.x = cur_pose.position.x + x
+        p.position.y = cur_pose.position.y + y
+        p.position.z = cur_pose.position.z + z
+        p.orientation.x = cur_pose.orientation.x
+        p.orientation.y = cur_pose.orientation.y
+        p.orientation.z = cur_pose.orientation.z
+        p.orientation.w = cur_pose.orientation.w
 
         self.arm_pose = p
-        self.arm_group.set_pose_target(self.arm_pose)
-        self.arm_group.go(wait= wait)
-        self.arm_group.clear_pose_targets()
+        self._Go(p, wait)
 
     def MoveTo(self, x, y, z, wait= True):
         """Assign x, y, z to robot position"""
-        cur_pose = self.arm_group.get_current_pose()
+        cur_pose = self.CurrentPose()
         p = Pose()
         p.position.x = x
         p.position.y = y
         p.position.z = z
-        p.orientation.x = cur_pose.pose.orientation.x
-        p.orientation.y = cur_pose.pose.orientation.y
-        p.orientation.z = cur_pose.pose.orientation.z
-        p.orientation.w = cur_pose.pose.orientation.w
+        p.orientation.x = cur_pose.orientation.x
+        p.orientation.y = cur_pose.orientation.y
+        p.orientation.z = cur_pose.orientation.z
+        p.orientation.w = cur_pose.orientation.w
 
         self.arm_pose = p
-        self.arm_group.set_pose_target(p)
-        self.arm_group.go(wait= wait)
-        self.arm_group.clear_pose_targets()
+        self._Go(p, wait)
+
+    def MoveAlong(self, moves: list, wait= True):
+        """Follow moves [(relative, x, y, z)] as one Cartesian path, without stopping at the waypoints"""
+        cur_pose = self.CurrentPose()
+        waypoints = []
+        prev = cur_pose.position
+        for relative, x, y, z in moves:
+            p = Pose()
+            p.position.x = prev.x + x if relative else x
+            p.position.y = prev.y + y if relative else y
+            p.position.z = prev.z + z if relative else z
+            p.orientation = cur_pose.orientation
+            waypoints.append(p)
+            prev = p.position
+
+        # 1 cm interpolation, no jump threshold
+        plan, fraction = self.arm_group.compute_cartesian_path(waypoints, 0.01, 0.0)
+        if fraction < 1.0:
+            print(f'RobotArm:: Cartesian path only {fraction * 100:.0f}% feasible, moving segment by segment')
+            for p in waypoints:
+                self.arm_pose = p
+                self._Go(p, wait)
+            return
+
+        self.arm_pose = waypoints[-1]
+        self._Executed(waypoints[-1], self.arm_group.execute(plan, wait= wait), wait)
+
+    def _Go(self, pose: Pose, wait= True):
+        """
+        Move to pose, reusing the cached trajectory when the arm has been sent there from here before.
+        A trajectory that fails to execute is evicted from the cache and the motion replanned once.
+        """
+        for attempt in range(2):
+            trajectory = self.planner.Plan(PoseTarget(pose))
+            if trajectory is None:
+                print(f'RobotArm:: no plan found to {PoseTarget(pose)}')
+                return
+
+            success = self.planner.Execute(trajectory, wait)
+            self._Executed(pose, success, wait)
+            if success is not False:
+                return
+            print(f'RobotArm:: trajectory to {PoseTarget(pose)} failed to execute (attempt {attempt + 1})')
+
+        raise Exception(f'RobotArm:: could not move to {PoseTarget(pose)}')
+
+    def _Executed(self, pose: Pose, success, wait: bool):
+        # Once a motion has completed, the arm is at its target. Otherwise ask the arm next time
+        if wait and success is not False:
+            self.state.SetPose(pose)
+        else:
+            self.state.Invalidate()
+
+    def CurrentPose(self) -> Pose:
+        """End effector pose, read from the state cache unless it may be stale"""
+        pose = self.state.Pose()
+        if pose is None:
+            pose = self.arm_group.get_current_pose().pose
+            self.state.SetPose(pose)
+        return pose
+
+    def CurrentJoints(self) -> tuple:
+        """Arm joint values, from /joint_states if recent enough"""
+        joints = self.state.Joints(maxAge= 0.1)
+        if joints is None:
+            joints = tuple(self.arm_group.get_current_joint_values())
+        return joints
+
+    def Position(self) -> tuple:
+        p = self.CurrentPose().position
+        return (p.x, p.y, p.z)
+
+    def _OnJointState(self, msg: JointState):
+        # joint_states covers the gripper as well; keep the arm joints, in move group order
+        positions = dict(zip(msg.name, msg.position))
+        if all(name in positions for name in self.arm_joints):
+            self.state.SetJoints(tuple(positions[name] for name in self.arm_joints))
 
     def OpenGripper(self, wait= True):
         self.gripper_group.set_named_target('Open')
@@ -129,7 +243,16 @@ class RobotArm:
         self.gripper_group.go(wait= wait)
         self.gripper_group.clear_pose_targets()
 
+    def AttachObject(self, id: str):
+        self.arm_group.attach_object(id)
+        self.sceneRevision += 1
+
+    def DetachObject(self):
+        self.arm_group.detach_object()
+        self.sceneRevision += 1
+
     def InitialiseDemoScene(self):
         self.scene.clear()
+        self.sceneRevision += 1
         out = []
         return out
\ No newline at end of file
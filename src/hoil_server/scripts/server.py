@@ -3,10 +3,16 @@
 import hoil_utils as HoilUtils
 from hoil_exec_node_builder import BuildExecNode
 import sys
-from hoil_exec_nodes import FunctionNode, NativeNode
+import argparse
+from hoil_exec_nodes import FunctionNode, MemoStats
 from hoil_dtypes import DType
+from hoil_array import HoilArray
+from hoil_natives import LoadNativeModules, InstallNatives
+from hoil_vm import RunProgram
+from hoil_program_cache import BuildCachedProgram
 
-from robot import SceneObject
+from arm_backend import SceneObject, SimulatedArm
+from hoil_plan_cache import CachedPlanner
 
 # Given 5 sticks of different heights, sort them in ascending order on another table
 # The sticks are located at <0, 0.25 ~ 0.5, height / 2>, and they must be sorted at <0.25 ~ 0.5, 0, ...>
@@ -16,48 +22,104 @@ from robot import SceneObject
 # If param and arg are identical, unexpected behaviour occurs.
 
 
+def ParseArgs(argv: list) -> argparse.Namespace:
+    """Parse server options. Unknown arguments (e.g. ROS remappings) are ignored."""
+    parser = argparse.ArgumentParser(description= 'Interpret and execute a HOIL IL program')
+    parser.add_argument('file', help= 'HOIL IL program to execute')
+    parser.add_argument('--expr-backend', choices= ['interp', 'closure'], default= 'interp',
+                        help= 'Evaluate expressions with the stack machine (interp) or compiled Python functions (closure)')
+    parser.add_argument('--vm', action= 'store_true',
+                        help= 'Compile the program to bytecode and run it on the VM instead of the tree walker')
+    parser.add_argument('--no-cache', action= 'store_true',
+                        help= 'Always parse the IL file instead of loading the compiled program cached in ~/.hoil/programs')
+    parser.add_argument('--no-memo', action= 'store_true',
+                        help= 'Do not memoize pure HOIL functions')
+    parser.add_argument('--sim', action= 'store_true',
+                        help= 'Run on a simulated arm instead of the MoveIt arm. No ROS master needed')
+    parser.add_argument('--sim-latency', type= float, default= 0.0,
+                        help= 'With --sim, seconds every simulated motion takes')
+    parser.add_argument('--sim-planning', type= float, default= 0.0,
+                        help= 'With --sim, seconds planning a motion takes')
+    parser.add_argument('--sim-seed', type= int, default= 0,
+                        help= 'With --sim, seed of the demo scene, so that runs are reproducible')
+    parser.add_argument('--sync-motion', action= 'store_true',
+                        help= 'Wait for every motion to finish before continuing, instead of queueing it')
+    parser.add_argument('--no-coalesce', action= 'store_true',
+                        help= 'Send every MoveTo/MoveBy as its own motion instead of joining consecutive ones into one path')
+    parser.add_argument('--natives', action= 'append', default= [],
+                        help= 'Module defining natives with hoil_natives.Native to load, in addition to those in $HOIL_NATIVES. Repeatable')
+    parser.add_argument('--stats', action= 'store_true',
+                        help= 'Print runtime statistics after execution')
+    parser.add_argument('--verbose', action= 'store_true',
+                        help= 'Print the translated code of every instruct stmt as it runs')
+    parser.add_argument('--fuzzy-threshold', type= float, default= None,
+                        help= 'Reuse the stored translation of a different instruct stmt that is at least this similar (0 - 1, e.g. 0.9). '
+                              'Off by default: only identical stmts are reused')
+    parser.add_argument('--no-fuzzy', action= 'store_true',
+                        help= 'Only reuse stored translations of identical instruct stmts, even with --fuzzy-threshold')
+    parser.add_argument('--no-local', action= 'store_true',
+                        help= 'Do not translate common instruct stmt shapes locally, always ask the store and the LLM')
+    parser.add_argument('--no-lower', action= 'store_true',
+                        help= 'Always exec() instruct translations instead of rewriting them into native nodes')
+    parser.add_argument('--lazy', action= 'store_true',
+                        help= 'Translate instruct stmts when they first run instead of before execution')
+    parser.add_argument('--prefetch', type= int, default= 4,
+                        help= 'With --lazy, number of following instruct stmts translated ahead in the background')
+
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
 class HoilServer:
 
     def __init__(self):
         # TODO: Create a ROSNode that feeds HOIL bytecode
         # TODO: Create a HOIL Function generation code
-        file = sys.argv[1]
-        with open(file, 'r') as f:
-            data = f.read()
-
-
-        self.container = HoilUtils.ExecVarContainer(noROS= False)
-        self.node = BuildExecNode(data, self.container)
+        args = ParseArgs(sys.argv[1:])
+
+        robot = SimulatedArm(latency= args.sim_latency, planningTime= args.sim_planning, seed= args.sim_seed) if args.sim else None
+        self.container = HoilUtils.ExecVarContainer(robot= robot, noROS= False, exprBackend= args.expr_backend, memoize= not args.no_memo,
+                                                    instructTable= HoilUtils.InstructTable(verbose= args.verbose,
+                                                        fuzzyThreshold= None if args.no_fuzzy else args.fuzzy_threshold,
+                                                        lazy= args.lazy, prefetch= args.prefetch, local= not args.no_local,
+                                                        lower= not args.no_lower))
+        if args.no_cache:
+            with open(args.file, 'r') as f:
+                self.node = BuildExecNode(f, self.container)
+        else:
+            self.node = BuildCachedProgram(args.file, self.container)
+
+        self.container.motion.asynchronous = not args.sync_motion
+        self.container.motion.coalesce = not args.no_coalesce
 
         # Insert functions
-        FunctionNode.MakeFunction(self.container, 'Print', ['text'],\
-                                  NativeNode(self.container, self.Print))
+        FunctionNode.MakeNative(self.container, 'Print', ['text'], self.Print)
         
-        FunctionNode.MakeFunction(self.container, 'MoveTo', ['x', 'y', 'z'],\
-                                  NativeNode(self.container, self.MoveTo))
+        FunctionNode.MakeNative(self.container, 'MoveTo', ['x', 'y', 'z'], self.MoveTo)
         
-        FunctionNode.MakeFunction(self.container, 'MoveBy', ['x', 'y', 'z'],\
-                                  NativeNode(self.container, self.MoveBy))
+        FunctionNode.MakeNative(self.container, 'MoveBy', ['x', 'y', 'z'], self.MoveBy)
         
-        FunctionNode.MakeFunction(self.container, 'Grab', ['obj'],\
-                                  NativeNode(self.container, self.Grab))
+        FunctionNode.MakeNative(self.container, 'Grab', ['obj'], self.Grab)
         
-        FunctionNode.MakeFunction(self.container, 'Release', [],\
-                                  NativeNode(self.container, self.Release))
+        FunctionNode.MakeNative(self.container, 'Release', [], self.Release)
+
+        FunctionNode.MakeNative(self.container, 'Sync', [], self.Sync)
         
-        FunctionNode.MakeFunction(self.container, 'PositionOf', ['obj'],\
-                                  NativeNode(self.container, self.PositionOf))
+        FunctionNode.MakeNative(self.container, 'PositionOf', ['obj'], self.PositionOf)
+
+        FunctionNode.MakeNative(self.container, 'ArmPosition', [], self.ArmPosition)
         
-        FunctionNode.MakeFunction(self.container, 'HeightOf', ['obj'],\
-                                  NativeNode(self.container, self.HeightOf))
+        # Not pure: a str arg names a variable, so the same arg can mean another object later
+        FunctionNode.MakeNative(self.container, 'HeightOf', ['obj'], self.HeightOf)
+
+        # Array and batch scene natives (Sum, ArgSort, HeightsOf...), plus the ones of --natives / $HOIL_NATIVES modules
+        LoadNativeModules()
+        LoadNativeModules(args.natives)
+        InstallNatives(self.container)
         
 
         # Add an array that contains 5 unordered sticks
-        boxObjs = {}
-        for i in range(len(self.container.robot.scene_objects)):
-            # dtype = DType(self.container, fixed= True)
-            # dtype.AssignValue(self.container.robot.scene_objects[i])
-            boxObjs[i] = self.container.robot.scene_objects[i]
+        boxObjs = HoilArray(self.container.robot.scene_objects)
         
         box_arr = DType(self.container, fixed= True, directAssignment= True, expr= boxObjs)
         self.container.varTable.Insert("%boxes%", box_arr)
@@ -66,84 +128,92 @@ class HoilServer:
         self.container.instructTable.Evaluate()
         print('Executing...')
         print('-' * 100)
-        node = self.node
-        while node is not None:
-            node.Run()
-            node = node.next
-
-    def Print(self, container: HoilUtils.ExecVarContainer):
-        """Native function. Print %text% to the screen."""
-        s: DType
-        s = container.varTable.Get('%text%')
-        print(s.Get())
-
-    def MoveTo(self, container: HoilUtils.ExecVarContainer):
-        """Native function. Move arm to %x%, %y%, %z%"""
-        x: DType
-        y: DType
-        z: DType
-        x = container.varTable.Get("%x%")
-        y = container.varTable.Get("%y%")
-        z = container.varTable.Get("%z%")
-
-        print(f'Move to {x.Get()}, {y.Get()}, {z.Get()}')
-        container.robot.MoveTo(x.Get(), y.Get(), z.Get())
-
-    def MoveBy(self, container: HoilUtils.ExecVarContainer):
-        """Native function. Move arm to %x%, %y%, %z%"""
-        x: DType
-        y: DType
-        z: DType
-        x = container.varTable.Get("%x%")
-        y = container.varTable.Get("%y%")
-        z = container.varTable.Get("%z%")
-
-        print(f'Move by {x.Get()}, {y.Get()}, {z.Get()}')
-        container.robot.MoveBy(x.Get(), y.Get(), z.Get())
-
-    def Grab(self, container: HoilUtils.ExecVarContainer):
+        if args.vm:
+            RunProgram(self.node, self.container)
+        else:
+            node = self.node
+            while node is not None:
+                node.Run()
+                node = node.next
+
+        # Wait for the arm to finish the queued motions
+        self.container.motion.Sync()
+        self.container.motion.Close()
+        self.container.instructTable.Close()
+
+        if args.stats:
+            print('-' * 100)
+            for name, stats in MemoStats(self.container).items():
+                print(f'Memo {name}: {stats}')
+            planner = getattr(self.container.robot, 'planner', None)
+            if isinstance(planner, CachedPlanner):
+                print(f'Plan cache: {planner.cache.Stats()}')
+            state = getattr(self.container.robot, 'state', None)
+            if state is not None:
+                print(f'Arm state cache: {state.Stats()}')
+            if self.container.instructTable.local is not None:
+                print(f'Local translation: {self.container.instructTable.local.Stats()}')
+
+    def Print(self, text):
+        """Native function. Print text to the screen."""
+        print(text)
+
+    def MoveTo(self, x, y, z):
+        """Native function. Move arm to x, y, z"""
+        print(f'Move to {x}, {y}, {z}')
+        self.container.motion.MoveTo(x, y, z)
+
+    def MoveBy(self, x, y, z):
+        """Native function. Move arm by x, y, z"""
+        print(f'Move by {x}, {y}, {z}')
+        self.container.motion.MoveBy(x, y, z)
+
+    def Grab(self, obj):
         """Native function. Close the gripper and call attach_object internally"""
-        obj: DType
-        obj = container.varTable.Get('%obj%')
+        obj = self._Object(obj)
 
-        # TODO: Specify type in llm-based function calling so it doesnt confuse obj with str
-        if isinstance(obj.Get(), str):
-            obj = container.varTable.Get(f'%{obj.Get()}%')
+        # The arm has to be at the object before the gripper closes on it
+        self.container.motion.Sync()
+        self.container.robot.CloseGripper()
+        self.container.robot.AttachObject(obj.id)
 
-        container.robot.CloseGripper()
-        container.robot.arm_group.attach_object(obj.Get().id)
-
-    def Release(self, container: HoilUtils.ExecVarContainer):
+    def Release(self):
         """Native function. Release the gripper and detach_object"""
-        container.robot.OpenGripper()
-        container.robot.arm_group.detach_object()
+        self.container.motion.Submit('Release', self._Release, self.container.robot)
+
+    def _Release(self, robot):
+        robot.OpenGripper()
+        robot.DetachObject()
 
-    def PositionOf(self, container: HoilUtils.ExecVarContainer):
+    def Sync(self):
+        """Native function. Wait until the arm has finished every queued motion"""
+        self.container.motion.Sync()
+
+    def PositionOf(self, obj):
         """Native function. Get the position of object"""
-        obj: DType
-        obj = container.varTable.Get('%obj%')
+        self.container.SyncMotion()
 
-        # TODO: Specify type in llm-based function calling so it doesnt confuse obj with str
-        if isinstance(obj.Get(), str):
-            obj = container.varTable.Get(f'%{obj.Get()}%')
+        obj = self._Object(obj)
+        return HoilArray([obj.x, obj.y, obj.z])
         
-        # HOIL array is internally a dict() for now.
-        # TODO: Refactor returnVal
-        self.container.returnVal.append(
-            {0: obj.Get().x, 1: obj.Get().y, 2: obj.Get().z})
-        
-    def HeightOf(self, container: HoilUtils.ExecVarContainer):
+    def ArmPosition(self):
+        """Native function. Get the position of the end effector, once the queued motions are done"""
+        self.container.motion.Sync()
+        x, y, z = self.container.robot.Position()
+        return HoilArray([x, y, z])
+
+    def HeightOf(self, obj):
         """Native function. Get the height of object"""
-        obj: DType
-        obj = container.varTable.Get('%obj%')
+        return self._Object(obj).height
 
+    def _Object(self, obj):
+        """Scene object obj, or the one in the variable named obj"""
         # TODO: Specify type in llm-based function calling so it doesnt confuse obj with str
-        if isinstance(obj.Get(), str):
-            obj = container.varTable.Get(f'%{obj.Get()}%')
-        
-        # HOIL array is internally a dict() for now.
-        # TODO: Refactor returnVal
-        self.container.returnVal.append(obj.Get().height)
+        if isinstance(obj, str):
+            var: DType
+            var = self.container.varTable.Get(f'%{obj}%')
+            return var.Get()
+        return obj
 
 
 
@@ -0,0 +1,54 @@
+import io
+import os
+import sys
+
+import pytest
+
+# The server modules import each other as top-level modules, as when run from scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from hoil_exec_node_builder import BuildExecNode
+from hoil_exec_nodes import FunctionNode
+from hoil_translation import FakeProvider
+from hoil_translation_store import TranslationStore
+from hoil_utils import ExecVarContainer, InstructTable
+from hoil_vm import RunProgram
+
+
+@pytest.fixture
+def new_container(tmp_path):
+    """
+    Factory of fresh containers without ROS, translating instruct stmts offline with provider
+    (a FakeProvider by default) into a store in tmp_path. Other keyword args go to ExecVarContainer.
+    """
+    def NewContainer(provider= None, lower= True, **kwargs) -> ExecVarContainer:
+        table = InstructTable(provider= FakeProvider() if provider is None else provider, lower= lower,
+                              store= TranslationStore(str(tmp_path / 'translations.db')))
+        return ExecVarContainer(noROS= True, instructTable= table, **kwargs)
+    return NewContainer
+
+
+def RunNodes(node, container: ExecVarContainer, vm= False):
+    """Run a built program on the VM or the tree walker"""
+    if vm:
+        RunProgram(node, container)
+        return
+
+    while node is not None:
+        node.Run()
+        node = node.next
+
+
+@pytest.fixture
+def run_il(new_container):
+    """Run an IL program and return what it printed. vm selects the executor, container defaults to a new one"""
+    def RunIL(source: str, vm= False, container: ExecVarContainer = None) -> list:
+        if container is None:
+            container = new_container()
+        printed = []
+        node = BuildExecNode(io.StringIO(source), container)
+        FunctionNode.MakeNative(container, 'Print', ['text'], printed.append)
+        container.instructTable.Evaluate()
+        RunNodes(node, container, vm)
+        return printed
+    return RunIL
@@ -0,0 +1,10 @@
+from arm_backend import SimulatedArm
+
+
+def _Heights(arm: SimulatedArm) -> list:
+    return [obj.height for obj in arm.scene_objects]
+
+
+def test_seed_fixes_the_demo_scene():
+    assert _Heights(SimulatedArm(seed= 0)) == _Heights(SimulatedArm(seed= 0))
+    assert _Heights(SimulatedArm(seed= 0)) != _Heights(SimulatedArm(seed= 1))
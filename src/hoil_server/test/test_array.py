@@ -0,0 +1,113 @@
+import operator
+
+import pytest
+
+import hoil_array
+from hoil_array import HoilArray, NUMPY_MIN_SIZE, Sum, Min, Max, ArgMin, ArgMax, Sort, ArgSort, Elementwise
+
+
+def test_in_order_writes_stay_dense():
+    arr = HoilArray()
+    for i in range(3):
+        arr[float(i)] = i * 10.0
+    arr[1.0] = 5.0
+    del arr[2.0]
+
+    assert arr.IsDense()
+    assert arr == {0: 0.0, 1: 5.0}
+    assert arr[1.0] == arr[1] == 5.0
+    with pytest.raises(KeyError):
+        arr[2.0]
+
+
+@pytest.mark.parametrize('key', [5.0, -1.0, 0.5, '"name"'])
+def test_other_writes_turn_sparse(key):
+    arr = HoilArray([1.0, 2.0])
+    arr[key] = 3.0
+
+    assert not arr.IsDense()
+    assert arr == {0: 1.0, 1: 2.0, key: 3.0}
+    assert arr[key] == 3.0
+
+
+def test_deleting_inside_turns_sparse():
+    arr = HoilArray([1.0, 2.0, 3.0])
+    del arr[0.0]
+
+    assert not arr.IsDense()
+    assert list(arr.items()) == [(1, 2.0), (2, 3.0)]
+
+
+def test_interpolates_like_a_dict():
+    assert str(HoilArray([1.0, 2.0])) == '{0: 1.0, 1: 2.0}'
+    assert str(HoilArray.FromMapping({3: 1.0})) == '{3: 1.0}'
+
+
+# On each side of the size at which the bulk natives switch to NumPy, with and without it
+_Sizes = [NUMPY_MIN_SIZE - 1, NUMPY_MIN_SIZE]
+
+
+@pytest.fixture(params= ['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(hoil_array, 'numpy', None)
+    return request.param
+
+
+def _Values(size: int) -> list:
+    """Floats with ties on the smallest and largest values"""
+    return [float((i * 37) % 11) for i in range(size)]
+
+
+@pytest.mark.parametrize('size', _Sizes)
+def test_reductions(backend, size):
+    values = _Values(size)
+    arr = HoilArray(values)
+
+    assert Sum(arr) == pytest.approx(sum(values))
+    assert Min(arr) == min(values) and Max(arr) == max(values)
+    assert ArgMin(arr) == float(values.index(min(values)))
+    assert ArgMax(arr) == float(values.index(max(values)))
+    assert type(ArgMin(arr)) is float
+
+
+@pytest.mark.parametrize('size', _Sizes)
+def test_sorting(backend, size):
+    values = _Values(size)
+    arr = HoilArray(values)
+
+    assert list(Sort(arr).values()) == sorted(values)
+    assert list(ArgSort(arr).values()) == [float(i) for i in sorted(range(size), key= values.__getitem__)]
+
+
+@pytest.mark.parametrize('size', _Sizes)
+def test_elementwise(backend, size):
+    values = _Values(size)
+    arr = HoilArray(values)
+
+    assert list(Elementwise(operator.add, arr, arr).values()) == [x + x for x in values]
+    assert list(Elementwise(operator.mul, arr, 0.5).values()) == [x * 0.5 for x in values]
+    assert Elementwise(operator.sub, arr, 1.0).IsDense()
+
+
+@pytest.mark.parametrize('size', _Sizes)
+def test_sparse_arrays_keep_their_indices(backend, size):
+    arr = HoilArray.FromMapping({ float(i * 2): v for i, v in enumerate(_Values(size)) })
+
+    assert ArgMax(arr) == 2.0 * _Values(size).index(max(_Values(size)))
+    assert list(Elementwise(operator.add, arr, 1.0).keys()) == list(arr.keys())
+
+
+@pytest.mark.parametrize('size', _Sizes)
+@pytest.mark.parametrize('op, b', [(operator.add, '"text"'), (operator.truediv, 0.0), (operator.add, HoilArray([1.0]))])
+def test_elementwise_errors_are_hoil_errors(backend, size, op, b):
+    with pytest.raises(Exception, match= '^Elementwise::'):
+        Elementwise(op, HoilArray(_Values(size)), b)
+
+
+def test_empty_array():
+    assert Sum(HoilArray()) == 0
+    with pytest.raises(Exception, match= '^ArgMin::'):
+        ArgMin(HoilArray())
@@ -0,0 +1,45 @@
+from hoil_dtypes import DType, StringCell
+
+
+def test_cell_class_follows_string_values(new_container):
+    container = new_container()
+    var = DType(container, 3.0, directAssignment= True)
+    assert type(var) is DType
+
+    var.AssignValue('"text"')
+    assert type(var) is StringCell
+    assert var.Get() == '"text"'
+    var.AssignValue({0: 1.0})
+    assert type(var) is DType
+    assert var.Get() == {0: 1.0}
+
+
+def test_real_variable_assigned_string_is_interpolated(run_il):
+    # The declared type does not pick the cell, the value does
+    printed = run_il('$decl %x% $real 2\n'
+                   '$decl %s% $real 1\n'
+                   '$decl %s% $real "x is {x}"\n'
+                   '$call %Print% %s%\n')
+    assert printed == ['"x is 2.0"']
+
+
+def test_string_is_interpolated(new_container):
+    container = new_container()
+    container.varTable.Insert('%x%', DType(container, 2.0, directAssignment= True))
+    var = DType(container, '"x is {x}"', directAssignment= True)
+    assert var.Get() == '"x is 2.0"'
+
+
+def test_string_cell_assigned_none(new_container):
+    container = new_container()
+    var = StringCell(container, '"{x}"', directAssignment= True)
+    var.AssignValue(None)
+    assert type(var) is StringCell
+
+
+def test_declare_over_string_variable(run_il):
+    # The local translator turns "Declare name" into self.Decl('name'), which assigns None
+    printed = run_il('$decl %name% $string "stick"\n'
+                   '$instruct "Declare name"\n'
+                   '$call %Print% "done"\n')
+    assert printed == ['"done"']
@@ -0,0 +1,108 @@
+import pytest
+
+from hoil_dtypes import DType
+from hoil_exec_nodes import FunctionNode
+
+
+RETURN_IN_LOOP = '''$func_decl %firstOver% $real $param %limit% $real
+$open_scope
+$decl %n% $real 0
+$while 1
+$open_scope
+$decl %n% $real %n%;1;+
+$branch_begin
+$if %n%;%limit%;>
+$open_scope
+$return %n%
+$close_scope
+$if_end
+$branch_end
+$close_scope
+$while_end
+$return 0;1;-
+$close_scope
+$func_decl_end
+$decl %found% $real $,%firstOver%,2$^
+$call %Print% "found {found}"
+$decl %i% $real 0
+$while %i%;3;<
+$open_scope
+$decl %i% $real %i%;1;+
+$branch_begin
+$if %i%;2;==
+$open_scope
+$continue
+$close_scope
+$if_end
+$branch_end
+$call %Print% "i {i}"
+$close_scope
+$while_end
+'''
+
+
+@pytest.mark.parametrize('vm', [False, True], ids= ['tree', 'vm'])
+def test_return_leaves_loop(run_il, vm):
+    assert run_il(RETURN_IN_LOOP, vm) == ['"found 3.0"', '"i 1.0"', '"i 3.0"']
+
+
+# f passes "{y}" on, so it reads y when g interpolates its param
+TEMPLATE_ARG = '''$func_decl %g% $real $param %p% $real
+$open_scope
+$return %p%
+$close_scope
+$func_decl_end
+$func_decl %f% $real $param
+$open_scope
+$return $,%g%,"{y}"$^
+$close_scope
+$func_decl_end
+$decl %y% $real 1
+$decl %a% $real $,%f%,$^
+$decl %y% $real 2
+$decl %b% $real $,%f%,$^
+$call %Print% %a%
+$call %Print% %b%
+'''
+
+
+@pytest.mark.parametrize('vm', [False, True], ids= ['tree', 'vm'])
+@pytest.mark.parametrize('memoize', [True, False], ids= ['memo', 'no-memo'])
+def test_function_reading_placeholders_is_not_memoized(new_container, run_il, vm, memoize):
+    container = new_container(memoize= memoize)
+    assert run_il(TEMPLATE_ARG, vm, container) == ['"1.0"', '"2.0"']
+    assert not container.functionMap['%f%'].IsPure()
+
+
+# The value of a fixed variable's redeclaration is never evaluated
+REDECL_FIXED = '''$decl %v% $real $,%Effect%,2$^
+$call %Print% %v%
+'''
+
+
+@pytest.mark.parametrize('vm', [False, True], ids= ['tree', 'vm'])
+def test_redeclaring_fixed_variable_skips_value(new_container, run_il, vm):
+    container = new_container()
+    container.varTable.Insert('%v%', DType(container, 1.0, directAssignment= True, fixed= True))
+    effects = []
+    FunctionNode.MakeNative(container, 'Effect', ['x'], lambda x: effects.append(x) or x)
+    assert run_il(REDECL_FIXED, vm, container) == [1.0]
+    assert effects == []
+
+
+# Outside functions $return has nothing to return from
+TOP_LEVEL_RETURN = '''$call %Print% "before"
+$return $,%Effect%,5$^
+$call %Print% "after"
+$return
+$call %Print% "end"
+'''
+
+
+@pytest.mark.parametrize('vm', [False, True], ids= ['tree', 'vm'])
+def test_top_level_return_goes_on(new_container, run_il, vm):
+    container = new_container()
+    effects = []
+    FunctionNode.MakeNative(container, 'Effect', ['x'], effects.append)
+    assert run_il(TOP_LEVEL_RETURN, vm, container) == ['"before"', '"after"', '"end"']
+    assert effects == [5.0]
@@ -0,0 +1,22 @@
+import pytest
+
+from hoil_utils import CompileExpr, EvaluateExpr, ExecVarContainer
+
+
+@pytest.mark.parametrize('backend', ['interp', 'closure'])
+@pytest.mark.parametrize('op', ['&&', '||'])
+def test_logical_ops_evaluate_both_operands(backend, op):
+    container = ExecVarContainer(noROS= True, exprBackend= backend)
+    short = '0' if op == '&&' else '1'
+    expr = CompileExpr(f'{short};%missing%;{op}', container.symbols)
+
+    with pytest.raises(Exception, match= 'before assignment'):
+        EvaluateExpr(expr, container)
+
+
+@pytest.mark.parametrize('backend', ['interp', 'closure'])
+def test_backends_agree(backend):
+    container = ExecVarContainer(noROS= True, exprBackend= backend)
+    assert EvaluateExpr(CompileExpr('2;3;*;1;-', container.symbols), container) == 5.0
+    assert EvaluateExpr(CompileExpr('1;0;&&;1;||', container.symbols), container) == 1.0
+    assert EvaluateExpr(CompileExpr('4;[;2;<', container.symbols), container) is True
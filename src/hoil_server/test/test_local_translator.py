@@ -0,0 +1,24 @@
+import pytest
+
+from hoil_local_translator import LocalTranslator
+
+
+@pytest.mark.parametrize('stmt, code', [
+    ('"If {x} is 3"', "self.value = self.ValueOf('x') == 3"),
+    ('"while count is less than 10"', "self.value = self.ValueOf('count') < 10"),
+    ('"x is at least 2.5"', "self.value = self.ValueOf('x') >= 2.5"),
+    ('"Until {done} is true"', "self.value = not (self.ValueOf('done') == True)"),
+    ('"Increase {n} by 2"', "self.Assign('n', self.ValueOf('n') + 2)"),
+    # The keyword must be a word of its own
+    ('"ifx is 3"', "self.value = self.ValueOf('ifx') == 3"),
+    ('"whenever is 1"', "self.value = self.ValueOf('whenever') == 1"),
+])
+def test_translates(stmt, code):
+    assert LocalTranslator().Translate(stmt) == code
+
+
+@pytest.mark.parametrize('stmt', [
+    '"If the gripper is open"',
+])
+def test_leaves_unknown_shapes_to_the_provider(stmt):
+    assert LocalTranslator().Translate(stmt) is None
@@ -0,0 +1,108 @@
+import pytest
+
+from hoil_exec_nodes import LowerTranslation
+from hoil_translation import FakeProvider
+
+
+# Instruct stmts the local translator leaves to the provider, and their translations
+TRANSLATIONS = {
+    '"Frob x"': "self.Assign('x', self.ValueOf('x') * 2 + 1)",
+    '"Check x"': "self.value = self.ValueOf('x') > 3",
+    '"Show x"': "self.Call('Print', [self.ValueOf('x') - 1])",
+    '"Pick second"': "self.Assign('y', self.ValueOf('arr')[1])",
+    '"Double y"': "self.Assign('y', self.Call('double', [self.ValueOf('y')]))",
+    '"Check flag"': "self.value = self.ValueOf('flag') or self.ValueOf('missing')",
+    '"Check quietly"': "self.value = self.ValueOf('x') < 0 and self.Call('Print', [0])",
+}
+
+PROGRAM = '''$func_decl %double% $real $param %v% $real
+$open_scope
+$return %v%;2;*
+$close_scope
+$func_decl_end
+$decl %x% $real 3
+$decl %flag% $real true
+$decl %arr% $array
+$insert %arr% 0 10
+$insert %arr% 1 20
+$decl %y% $real 0
+$instruct "Frob x"
+$branch_begin
+$if $instruct "Check x"
+$open_scope
+$call %Print% "big {x}"
+$close_scope
+$if_end
+$branch_end
+$instruct "Show x"
+$instruct "Pick second"
+$instruct "Double y"
+$call %Print% "y {y}"
+$branch_begin
+$if $instruct "Check flag"
+$open_scope
+$call %Print% "flag"
+$close_scope
+$if_end
+$branch_end
+$branch_begin
+$if $instruct "Check quietly"
+$open_scope
+$call %Print% "negative"
+$close_scope
+$if_end
+$branch_end
+'''
+
+
+@pytest.mark.parametrize('vm', [False, True], ids= ['tree', 'vm'])
+def test_lowered_translations_match_exec(new_container, run_il, vm):
+    outputs = []
+    for lower in (True, False):
+        container = new_container(provider= FakeProvider(TRANSLATIONS), lower= lower)
+        outputs.append(run_il(PROGRAM, vm, container))
+
+    assert outputs[0] == outputs[1] == ['"big 7.0"', 6.0, '"y 40.0"', '"flag"']
+
+
+@pytest.mark.parametrize('stmt', ['"Frob x"', '"Check x"', '"Show x"', '"Pick second"', '"Double y"'])
+def test_translation_is_lowered(new_container, stmt):
+    assert LowerTranslation(TRANSLATIONS[stmt], new_container()) is not None
+
+
+@pytest.mark.parametrize('code', [
+    # Python skips the right operand, HOIL would evaluate it
+    TRANSLATIONS['"Check flag"'],
+    TRANSLATIONS['"Check quietly"'],
+    "self.value = self.ValueOf('x') or 1 / self.ValueOf('y')",
+    # Not expressible in IL
+    "self.value = 'text'",
+    "self.value = 1 < self.ValueOf('x') < 3",
+    "self.Decl('x')",
+])
+def test_translation_is_not_lowered(new_container, code):
+    assert LowerTranslation(code, new_container()) is None
+
+
+DEEP = '''$func_decl %count% $real $param %n% $real %acc% $real
+$open_scope
+$branch_begin
+$if %n%;0;<=
+$open_scope
+$return %acc%
+$close_scope
+$if_end
+$branch_end
+$return $,%count%,%n%;1;-,%acc%;1;+$^
+$close_scope
+$func_decl_end
+$instruct "Count down"
+$call %Print% "{r}"
+'''
+
+
+def test_lowered_call_recurses_on_the_vm(new_container, run_il):
+    code = "self.Assign('r', self.Call('count', [5000, 0]))"
+    container = new_container(provider= FakeProvider({'"Count down"': code}))
+    assert LowerTranslation(code, container) is not None
+    assert run_il(DEEP, True, container) == ['"5000.0"']
@@ -0,0 +1,94 @@
+import pytest
+
+from arm_backend import SimulatedArm
+from hoil_motion import MotionQueue
+
+
+class _FailingArm(SimulatedArm):
+    """Simulated arm refusing to move below the table"""
+    def MoveTo(self, x, y, z, wait= True):
+        if z < 0:
+            raise Exception(f'unreachable {z}')
+        super().MoveTo(x, y, z, wait)
+
+
+class _PathFailingArm(SimulatedArm):
+    def MoveAlong(self, moves: list, wait= True):
+        raise Exception('path failed')
+
+
+
+def test_error_fails_later_commands_until_sync():
+    arm = _FailingArm()
+    motion = MotionQueue(arm, coalesce= False)
+    failed = motion.MoveTo(0.5, 0.0, -1.0)
+    skipped = motion.CloseGripper()
+
+    with pytest.raises(Exception, match= 'unreachable'):
+        motion.Sync()
+    assert skipped.exception() is failed.exception()
+    assert arm.gripperOpen
+
+    # Sync() reported the error, so the queue runs commands again
+    motion.MoveTo(0.4, 0.0, 0.4)
+    motion.Sync()
+    assert arm.Position() == (0.4, 0.0, 0.4)
+    motion.Close()
+
+
+def test_synchronous_queue_raises_at_the_call():
+    arm = _FailingArm()
+    motion = MotionQueue(arm, asynchronous= False)
+
+    with pytest.raises(Exception, match= 'unreachable'):
+        motion.MoveTo(0.5, 0.0, -1.0)
+    motion.MoveTo(0.4, 0.0, 0.4)
+    assert arm.Position() == (0.4, 0.0, 0.4)
+
+
+def test_consecutive_motions_coalesce():
+    arm = SimulatedArm()
+    motion = MotionQueue(arm)
+    futures = [motion.MoveTo(0.4, 0.1, 0.3), motion.MoveBy(0.0, 0.0, 0.1), motion.MoveTo(0.5, 0.0, 0.5)]
+    motion.OpenGripper()
+    motion.MoveTo(0.3, 0.2, 0.2)
+    motion.Sync()
+
+    # The three motions before OpenGripper go as one path, then the gripper, then the last motion
+    assert arm.motions == 3
+    assert all(future.done() for future in futures)
+    assert arm.Position() == (0.3, 0.2, 0.2)
+    motion.Close()
+
+
+def test_waypoint_limit_flushes_the_path():
+    arm = SimulatedArm()
+    motion = MotionQueue(arm, maxWaypoints= 2)
+    for i in range(5):
+        motion.MoveTo(0.1 * i, 0.0, 0.3)
+    motion.Sync()
+
+    assert arm.motions == 3
+    motion.Close()
+
+
+def test_no_coalescing_without_it():
+    arm = SimulatedArm()
+    motion = MotionQueue(arm, coalesce= False)
+    motion.MoveTo(0.4, 0.1, 0.3)
+    motion.MoveTo(0.5, 0.0, 0.5)
+    motion.Sync()
+
+    assert arm.motions == 2
+    motion.Close()
+
+
+def test_error_of_a_coalesced_path_reaches_every_motion():
+    arm = _PathFailingArm()
+    motion = MotionQueue(arm)
+    futures = [motion.MoveTo(0.4, 0.1, 0.3), motion.MoveTo(0.5, 0.0, 0.5)]
+
+    with pytest.raises(Exception, match= 'path failed'):
+        motion.Sync()
+    assert all(str(future.exception()) == 'path failed' for future in futures)
+    motion.Close()
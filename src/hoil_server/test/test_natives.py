@@ -0,0 +1,114 @@
+from collections import OrderedDict
+
+import pytest
+
+import hoil_natives
+from arm_backend import SceneObject, SimulatedArm
+from hoil_array import HoilArray
+from hoil_exec_nodes import FunctionNode, NativeNode
+from hoil_natives import HeightsOf, InstallNatives, LoadNativeModules, NATIVES_ENV, Natives, PositionsOf
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Registry of natives that is dropped after the test"""
+    monkeypatch.setattr(hoil_natives, '_Registry', OrderedDict(hoil_natives._Registry))
+    return hoil_natives._Registry
+
+
+def _Sticks() -> HoilArray:
+    return HoilArray([SceneObject('a', 0.0, 0.25, 0.05, 0.1), SceneObject('b', 0.0, 0.5, 0.1, 0.2)])
+
+
+def test_positions_without_motion_queue(new_container):
+    container = new_container()
+    assert container.motion is None
+    positions = PositionsOf(container, _Sticks())
+    assert [list(p.values()) for p in positions.values()] == [[0.0, 0.25, 0.05], [0.0, 0.5, 0.1]]
+
+
+def test_positions_wait_for_queued_motions(new_container):
+    arm = SimulatedArm(latency= 0.01)
+    container = new_container(robot= arm)
+    stick = arm.scene_objects[0]
+    arm.AttachObject(stick.id)
+    z = stick.z
+
+    container.motion.MoveBy(0.0, 0.0, 0.1)
+    assert PositionsOf(container, HoilArray([stick]))[0][2] == pytest.approx(z + 0.1)
+    container.motion.Close()
+
+
+def test_heights_keep_the_indices():
+    sticks = HoilArray.FromMapping({2.0: SceneObject('a', height= 0.1), 5.0: SceneObject('b', height= 0.3)})
+    assert HeightsOf(sticks) == {2.0: 0.1, 5.0: 0.3}
+
+
+def test_decorator_registers_a_native(registry):
+    @hoil_natives.Native(pure= True)
+    def Twice(x):
+        return 2 * x
+
+    @hoil_natives.Native(name= 'Scaled', withContainer= True)
+    def _Scaled(container, x, factor):
+        return x * factor
+
+    specs = { spec.name: spec for spec in Natives() }
+    assert specs['Twice'].params == ['x'] and specs['Twice'].pure
+    assert specs['Scaled'].params == ['x', 'factor'] and specs['Scaled'].withContainer
+
+
+PLUGIN = '''from hoil_natives import Native
+
+
+@Native(pure= True)
+def Cube(x):
+    return x * x * x
+'''
+
+
+def test_natives_are_loaded_from_the_environment(registry, tmp_path, monkeypatch, new_container, run_il):
+    (tmp_path / 'test_plugin_natives.py').write_text(PLUGIN)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv(NATIVES_ENV, ' test_plugin_natives , ')
+    LoadNativeModules()
+    assert 'Cube' in registry
+
+    container = new_container()
+    InstallNatives(container)
+    assert container.functionMap['%Cube%'].IsPure()
+    assert run_il('$decl %v% $real $,%Cube%,3$^\n$decl %arr% $array\n$insert %arr% 0 %v%\n'
+                  '$call %Print% $,%Sum%,%arr%$^\n', container= container) == [27.0]
+
+
+DIRECT = '''$decl %n% $real 7
+$decl %v% $real $,%Add2%,1,2$^;1;+
+$call %Log% "{n} {v}"
+$call %Add2% 5,5
+$decl %w% $real $,%Legacy%,4$^
+$call %Log% %w%
+'''
+
+
+@pytest.mark.parametrize('backend, vm', [('interp', False), ('closure', False), ('interp', True)])
+def test_natives_are_called_with_values(new_container, run_il, backend, vm):
+    container = new_container(exprBackend= backend)
+    logged = []
+    calls = []
+
+    def Add2(a, b):
+        calls.append((a, b))
+        return a + b
+
+    def Legacy(container):
+        # Old convention: read the params from the scope and push the value
+        container.returnVal.append(container.varTable.Get('%x%').Get() * 10)
+
+    FunctionNode.MakeNative(container, 'Add2', ['a', 'b'], Add2)
+    FunctionNode.MakeNative(container, 'Log', ['text'], logged.append)
+    FunctionNode.MakeFunction(container, 'Legacy', ['x'], NativeNode(container, Legacy))
+
+    run_il(DIRECT, vm, container)
+    assert calls == [(1.0, 2.0), (5.0, 5.0)]
+    assert logged == ['"7.0 4.0"', 40.0]
+    assert container.returnVal == []
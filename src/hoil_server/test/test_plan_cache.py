@@ -0,0 +1,87 @@
+from hoil_plan_cache import CachedPlanner, PlanCache, Planner
+
+
+class _Planner(Planner):
+    """Plans a fresh trajectory object per call. Executing one listed in failing fails"""
+    def __init__(self):
+        self.joints = (0.0, 0.0)
+        self.revision = 0
+        self.plans = 0
+        self.failing = set()
+
+    def CurrentJoints(self) -> tuple:
+        return self.joints
+
+    def SceneRevision(self) -> int:
+        return self.revision
+
+    def Plan(self, target: tuple):
+        self.plans += 1
+        return ['trajectory', target, self.plans]
+
+    def Execute(self, trajectory, wait= True):
+        return trajectory[2] not in self.failing
+
+
+def test_failed_trajectory_is_evicted():
+    planner = _Planner()
+    cached = CachedPlanner(planner)
+
+    first = cached.Plan((1.0, 2.0))
+    planner.failing.add(first[2])
+    assert cached.Execute(first) is False
+
+    second = cached.Plan((1.0, 2.0))
+    assert second is not first
+    assert planner.plans == 2
+    assert cached.Execute(second) is True
+    assert cached.Plan((1.0, 2.0)) is second
+
+
+def test_evict_missing_key():
+    cache = PlanCache()
+    cache.Evict(cache.Key((0.0,), (1.0,)))
+    assert cache.Stats()['size'] == 0
+
+
+def test_same_start_and_target_hit():
+    planner = _Planner()
+    cached = CachedPlanner(planner)
+
+    first = cached.Plan((1.0, 2.0))
+    # Within the quantization step of the start joints and target
+    planner.joints = (0.0002, 0.0)
+    assert cached.Plan((1.0001, 2.0)) is first
+    assert planner.plans == 1
+    assert cached.cache.Stats()['hits'] == 1
+
+    planner.joints = (0.5, 0.0)
+    assert cached.Plan((1.0, 2.0)) is not first
+    assert planner.plans == 2
+
+
+def test_scene_change_invalidates():
+    planner = _Planner()
+    cached = CachedPlanner(planner)
+
+    first = cached.Plan((1.0, 2.0))
+    planner.revision += 1
+    assert cached.Plan((1.0, 2.0)) is not first
+    assert cached.cache.Stats()['stale'] == 1
+    assert cached.cache.Stats()['size'] == 1
+
+
+def test_least_recently_used_is_evicted():
+    planner = _Planner()
+    cached = CachedPlanner(planner, PlanCache(maxSize= 2))
+
+    a = cached.Plan((1.0,))
+    cached.Plan((2.0,))
+    assert cached.Plan((1.0,)) is a
+    cached.Plan((3.0,))
+
+    assert cached.cache.Stats()['evictions'] == 1
+    assert cached.Plan((1.0,)) is a
+    assert planner.plans == 3
+    cached.Plan((2.0,))
+    assert planner.plans == 4
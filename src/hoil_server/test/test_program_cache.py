@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+import hoil_program_cache
+from hoil_program_cache import BuildCachedProgram, CachePath, LoadProgram
+from hoil_exec_nodes import FunctionNode
+
+
+PROGRAM = '''$decl %n% $real 2;3;*
+$call %Print% "n is {n}"
+'''
+
+
+def _Run(node, container) -> list:
+    printed = []
+    FunctionNode.MakeNative(container, 'Print', ['text'], printed.append)
+    while node is not None:
+        node.Run()
+        node = node.next
+    return printed
+
+
+def _Digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _Program(tmp_path, monkeypatch) -> str:
+    monkeypatch.setenv(hoil_program_cache.CACHE_ENV, str(tmp_path / 'cache'))
+    path = tmp_path / 'program.il'
+    path.write_text(PROGRAM)
+    return str(path)
+
+
+def test_cache_is_kept_out_of_the_program_directory(tmp_path, monkeypatch, new_container):
+    path = _Program(tmp_path, monkeypatch)
+    BuildCachedProgram(path, new_container())
+
+    assert os.path.dirname(CachePath(path)) == str(tmp_path / 'cache')
+    assert os.path.exists(CachePath(path))
+    assert [name for name in os.listdir(tmp_path) if name.endswith(hoil_program_cache.CACHE_SUFFIX)] == []
+
+
+def test_cached_program_runs_the_same(tmp_path, monkeypatch, new_container):
+    path = _Program(tmp_path, monkeypatch)
+    container = new_container()
+    built = _Run(BuildCachedProgram(path, container), container)
+
+    container = new_container()
+    node = LoadProgram(path, _Digest(path), container)
+    assert node is not None
+    assert _Run(node, container) == built == ['"n is 6.0"']
+
+
+def test_other_node_sources_miss_the_cache(tmp_path, monkeypatch, new_container):
+    path = _Program(tmp_path, monkeypatch)
+    BuildCachedProgram(path, new_container())
+
+    monkeypatch.setattr(hoil_program_cache, 'CACHE_VERSION', 'other')
+    assert LoadProgram(path, _Digest(path), new_container()) is None
+
+
+PURE_PROGRAM = '''$func_decl %square% $real $param %x% $real
+$open_scope
+$return %x%;%x%;*
+$close_scope
+$func_decl_end
+$decl %a% $real $,%square%,3$^
+$decl %b% $real $,%square%,3$^
+$call %Print% "{a} {b}"
+'''
+
+
+def test_cached_functions_keep_their_analysis(tmp_path, monkeypatch, new_container):
+    path = _Program(tmp_path, monkeypatch)
+    with open(path, 'w') as f:
+        f.write(PURE_PROGRAM)
+    BuildCachedProgram(path, new_container())
+
+    container = new_container()
+    node = LoadProgram(path, _Digest(path), container)
+    assert node is not None
+    assert _Run(node, container) == ['"9.0 9.0"']
+
+    square = container.functionMap['%square%']
+    assert square.IsPure() and square.FreeSlots() == frozenset()
+    assert square.memo.hits == 1
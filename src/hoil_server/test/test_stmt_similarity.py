@@ -0,0 +1,91 @@
+import pytest
+
+from hoil_stmt_similarity import StmtIndex, CanonicalStmt
+from hoil_translation import FakeProvider, TranslationEngine
+from hoil_translation_store import TranslationStore
+from hoil_utils import InstructTable
+
+
+# (stored stmt, its translation, stmt that must not reuse it)
+OPPOSITES = [
+    ('If the value of {height} is less than the value of {lowBound} then proceed',
+     "self.value = self.ValueOf('height') < self.ValueOf('lowBound')",
+     'If the value of {height} is not less than the value of {lowBound} then proceed'),
+    ('Increment the counter variable x by 5',
+     "self.Assign('x', self.ValueOf('x') + 5)",
+     'Decrement the counter variable x by 5'),
+    ('while the height of {box} is greater than 10',
+     "self.value = self.ValueOf('box') > 10",
+     'while the height of {box} is not greater than 10'),
+]
+
+
+def test_canonical_stmt():
+    assert CanonicalStmt('"Set {pos} to {Cube}."') == ('set {0} to {1}', ['pos', 'Cube'])
+
+
+@pytest.mark.parametrize('stored, code, stmt', OPPOSITES)
+def test_opposite_stmts_are_rejected(stored, code, stmt):
+    index = StmtIndex(threshold= 0.9)
+    index.Add(stored, code)
+
+    assert index.Lookup(stmt) is None
+    assert len(index.nearHits) == 1
+    assert not index.nearHits[0].accepted
+    assert index.nearHits[0].score >= 0.9
+
+
+def test_reformatted_stmt_is_reused_with_renamed_vars():
+    index = StmtIndex(threshold= 0.9)
+    index.Add('Set {pos} to {Cube}.', "self.Assign('pos', self.ValueOf('Cube'))")
+
+    assert index.Lookup('"set {p}  to {c}"') == "self.Assign('p', self.ValueOf('c'))"
+
+
+def test_different_numbers_are_rejected():
+    index = StmtIndex(threshold= 0.8)
+    index.Add('Move the arm up by 5 units', "self.Call('MoveBy', [0, 0, 5])")
+
+    assert index.Lookup('Move the arm up by 6 units') is None
+    assert index.nearHits[0].reason == 'numbers differ'
+
+
+def test_unmentioned_variable_is_rejected():
+    index = StmtIndex(threshold= 0.8)
+    index.Add('Double the value of x', "self.Assign('x', self.ValueOf('x') * 2)")
+
+    assert index.Lookup('Double the value of y') is None
+
+
+def _Table(path, stored: dict, fuzzyThreshold) -> tuple:
+    store = TranslationStore(str(path))
+    provider = FakeProvider(translate= lambda stmt: 'self.value = True')
+    table = InstructTable(engine= TranslationEngine(provider, backoff= 0.0), store= store,
+                          fuzzyThreshold= fuzzyThreshold, local= False, lower= False)
+    store.PutMany(stored, table._FunctionDesc(), provider.model)
+    return table, provider
+
+
+@pytest.mark.parametrize('stored, code, stmt', OPPOSITES)
+def test_table_asks_provider_for_opposite_stmts(tmp_path, stored, code, stmt):
+    table, provider = _Table(tmp_path / 'translations.db', {stored: code}, fuzzyThreshold= 0.9)
+    table.Insert(stmt)
+    table.Evaluate()
+
+    assert provider.calls == 1
+    assert table.Get(0) == 'self.value = True'
+
+
+def test_table_fuzzy_reuse_is_opt_in(tmp_path):
+    stored = {'Set {pos} to {Cube}.': "self.Assign('pos', self.ValueOf('Cube'))"}
+
+    table, provider = _Table(tmp_path / 'exact.db', stored, fuzzyThreshold= None)
+    table.Insert('set {p} to {c}')
+    table.Evaluate()
+    assert provider.calls == 1
+
+    table, provider = _Table(tmp_path / 'fuzzy.db', stored, fuzzyThreshold= 0.9)
+    table.Insert('set {p} to {c}')
+    table.Evaluate()
+    assert provider.calls == 0
+    assert table.Get(0) == "self.Assign('p', self.ValueOf('c'))"
@@ -0,0 +1,106 @@
+import pytest
+
+from hoil_translation import CompileTranslation, FakeProvider, TranslationEngine, TranslationProvider
+
+
+class _FlakyProvider(TranslationProvider):
+    """Raises on the first `failures` calls, then replies with replies(items)"""
+    model = 'flaky'
+
+    def __init__(self, replies, failures= 0):
+        self.replies = replies
+        self.failures = failures
+        self.calls = []
+
+    def Translate(self, items: list, functions: list) -> list:
+        self.calls.append([item['id'] for item in items])
+        if len(self.calls) <= self.failures:
+            raise Exception('provider unavailable')
+        return self.replies(items)
+
+
+def _Engine(provider, **kwargs) -> TranslationEngine:
+    return TranslationEngine(provider, backoff= 0.0, **kwargs)
+
+
+def test_batches_are_split_and_merged():
+    provider = FakeProvider(translate= lambda stmt: f'self.value = {len(stmt)}')
+    stmts = { i: 'x' * (i + 1) for i in range(5) }
+    out = _Engine(provider, maxBatchItems= 2).Translate(stmts, [])
+
+    assert provider.calls == 3
+    assert out == { i: f'self.value = {i + 1}' for i in range(5) }
+
+
+def test_batches_are_bounded_by_size():
+    provider = FakeProvider(translate= lambda stmt: 'self.value = 1')
+    _Engine(provider, maxBatchChars= 10).Translate({ i: 'x' * 6 for i in range(3) }, [])
+    assert provider.calls == 3
+
+
+def test_failed_batch_is_retried():
+    provider = _FlakyProvider(lambda items: [{'id': item['id'], 'exec': 'self.value = 1'} for item in items], failures= 2)
+    out = _Engine(provider).Translate({0: 'a', 1: 'b'}, [])
+
+    assert out == {0: 'self.value = 1', 1: 'self.value = 1'}
+    assert len(provider.calls) == 3
+
+
+def test_gives_up_after_the_retries():
+    provider = _FlakyProvider(lambda items: [], failures= 10)
+    assert _Engine(provider, retries= 2).Translate({0: 'a'}, []) == dict()
+    assert len(provider.calls) == 3
+
+
+def test_only_missing_ids_are_retried():
+    # Answers the first stmt of each batch only
+    provider = _FlakyProvider(lambda items: [{'id': items[0]['id'], 'exec': 'self.value = 1'}])
+    out = _Engine(provider).Translate({0: 'a', 1: 'b', 2: 'c'}, [])
+
+    assert provider.calls == [[0, 1, 2], [1, 2], [2]]
+    assert sorted(out) == [0, 1, 2]
+
+
+def test_invalid_items_are_dropped():
+    def Replies(items):
+        return [
+            {'id': '0', 'exec': 'self.value = 0'},
+            {'id': 1},
+            {'id': 1, 'exec': ['self.value = 1']},
+            'self.value = 1',
+            {'id': 7, 'exec': 'self.value = 7'},
+        ]
+
+    provider = _FlakyProvider(Replies)
+    out = _Engine(provider, retries= 1).Translate({0: 'a', 1: 'b'}, [])
+
+    assert out == {0: 'self.value = 0'}
+    assert provider.calls == [[0, 1], [1]]
+
+
+def test_reply_that_is_not_a_list_is_retried():
+    provider = _FlakyProvider(lambda items: {'id': 0, 'exec': 'self.value = 0'} if len(provider.calls) == 1
+                              else [{'id': 0, 'exec': 'self.value = 0'}])
+    assert _Engine(provider).Translate({0: 'a'}, []) == {0: 'self.value = 0'}
+    assert len(provider.calls) == 2
+
+
+@pytest.mark.parametrize('code', [
+    "self.value = self.ValueOf('x') + 1",
+    "self.Call('MoveTo', [0.5, 0.0, max(0.1, self.ValueOf('z'))])",
+])
+def test_translation_is_compiled(code):
+    assert CompileTranslation(code) is not None
+
+
+@pytest.mark.parametrize('code', [
+    'import os',
+    "__import__('os').system('true')",
+    'self.container = None',
+    'self.container.functionMap',
+    'open("file")',
+    'x = 1',
+])
+def test_unsafe_translation_is_rejected(code):
+    with pytest.raises(Exception):
+        CompileTranslation(code)
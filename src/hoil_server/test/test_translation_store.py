@@ -0,0 +1,41 @@
+import os
+
+from hoil_translation import FakeProvider, TranslationEngine
+from hoil_translation_store import STORE_ENV, TranslationStore
+from hoil_utils import InstructTable
+
+
+def _Table(provider: FakeProvider) -> InstructTable:
+    return InstructTable(engine= TranslationEngine(provider, backoff= 0.0), local= False, lower= False)
+
+
+def test_default_store_is_opened_on_first_use(tmp_path, monkeypatch):
+    path = str(tmp_path / 'translations.db')
+    monkeypatch.setenv(STORE_ENV, path)
+
+    table = _Table(FakeProvider())
+    table.Evaluate()
+    assert table.store is None
+    assert not os.path.exists(path)
+
+
+def test_new_default_store_imports_legacy_json(tmp_path, monkeypatch):
+    path = str(tmp_path / 'translations.db')
+    monkeypatch.setenv(STORE_ENV, path)
+
+    provider = FakeProvider()
+    table = _Table(provider)
+    table.Insert('"Move by 0.1 above"')
+    table.Evaluate()
+
+    assert provider.calls == 0
+    assert table.Get(0) == "self.Call('MoveBy', [0, 0, 0.1])"
+    assert len(TranslationStore(path)) == 6
+
+
+def test_put_and_get(tmp_path):
+    store = TranslationStore(str(tmp_path / 'translations.db'))
+    store.PutMany({'"Grab  the cube"': 'code'}, [], 'fake')
+
+    assert store.GetMany(['"Grab the cube"', '"Release"'], [], 'fake') == {'"Grab the cube"': 'code'}
+    assert store.GetMany(['"Grab the cube"'], [], 'other') == dict()
@@ -0,0 +1,127 @@
+import pytest
+
+from hoil_exec_nodes import MemoStats
+from hoil_vm import HoilVM
+
+
+COUNT = '''$func_decl %count% $real $param %n% $real %acc% $real
+$open_scope
+$branch_begin
+$if %n%;0;<=
+$open_scope
+$return %acc%
+$close_scope
+$if_end
+$branch_end
+$return $,%count%,%n%;1;-,%acc%;1;+$^
+$close_scope
+$func_decl_end
+'''
+
+SUM = '''$func_decl %sum% $real $param %n% $real
+$open_scope
+$branch_begin
+$if %n%;0;<=
+$open_scope
+$return 0
+$close_scope
+$if_end
+$branch_end
+$return $,%sum%,%n%;1;-$^;%n%;+
+$close_scope
+$func_decl_end
+'''
+
+
+def test_deep_tail_recursion(run_il):
+    assert run_il(COUNT + '$decl %r% $real $,%count%,20000,0$^\n$call %Print% "{r}"\n', vm= True) == ['"20000.0"']
+
+
+def test_deep_recursion(run_il):
+    assert run_il(SUM + '$decl %s% $real $,%sum%,20000$^\n$call %Print% "{s}"\n', vm= True) == ['"200010000.0"']
+
+
+PROGRAM = COUNT + SUM + '''$func_decl %fib% $real $param %k% $real
+$open_scope
+$branch_begin
+$if %k%;2;<
+$open_scope
+$return %k%
+$close_scope
+$if_end
+$branch_end
+$return $,%fib%,%k%;1;-$^;$,%fib%,%k%;2;-$^;+
+$close_scope
+$func_decl_end
+$func_decl %scaled% $real $param %v% $real
+$open_scope
+$return %v%;%scale%;*
+$close_scope
+$func_decl_end
+$decl %arr% $array
+$decl %i% $real 0
+$while %i%;10;<
+$open_scope
+$decl %i% $real %i%;1;+
+$branch_begin
+$if %i%;3;==
+$open_scope
+$continue
+$close_scope
+$if_end
+$elif %i%;8;==
+$open_scope
+$break
+$close_scope
+$elif_end
+$branch_end
+$insert %arr% %i% $,%fib%,%i%$^
+$close_scope
+$while_end
+$decl %scale% $real 2
+$decl %a% $real $,%scaled%,5$^
+$decl %scale% $real 3
+$decl %b% $real $,%scaled%,5$^
+$decl %c% $real $,%count%,50,0$^;$,%sum%,50$^;+
+$decl %last% $real $a,%arr%,7$^
+$call %Print% "{last} {a} {b} {c} {i}"
+'''
+
+
+def test_vm_matches_tree_walker(run_il):
+    tree = run_il(PROGRAM)
+    assert run_il(PROGRAM, vm= True) == tree
+    assert tree == ['"13.0 10.0 15.0 1325.0 8.0"']
+
+
+MEMO_TAIL = '''$func_decl %tenfold% $real $param %m% $real
+$open_scope
+$return %m%;10;*
+$close_scope
+$func_decl_end
+$func_decl %next% $real $param %n% $real
+$open_scope
+$return $,%tenfold%,%n%;1;+$^
+$close_scope
+$func_decl_end
+$decl %a% $real $,%tenfold%,4$^
+$decl %b% $real $,%next%,3$^
+$call %Print% "{a} {b}"
+'''
+
+
+@pytest.mark.parametrize('vm', [False, True], ids= ['tree', 'vm'])
+def test_memo_answers_a_tail_call(new_container, run_il, monkeypatch, vm):
+    tailCalls = []
+    tailCall = HoilVM._TailCall
+
+    def RecordTailCall(self, func, argSlots, frames):
+        pc = tailCall(self, func, argSlots, frames)
+        tailCalls.append((str(func), pc is not None))
+        return pc
+    monkeypatch.setattr(HoilVM, '_TailCall', RecordTailCall)
+
+    container = new_container()
+    assert run_il(MEMO_TAIL, vm, container) == ['"40.0 40.0"']
+    assert MemoStats(container)['tenfold']['hits'] == 1
+    assert tailCalls == ([('tenfold', True)] if vm else [])